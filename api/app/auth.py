@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import httpx
+import jwt
+
+from app.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# a provider that is down, or serves something that is not a configuration or
+# a JWKS: json decode errors are ValueErrors, a missing jwks_uri a KeyError
+REFRESH_ERRORS = (
+    httpx.HTTPError,
+    jwt.exceptions.PyJWTError,
+    ValueError,
+    KeyError,
+    TypeError,
+)
+
+
+class ClaimsCache:
+    """Bounded LRU of verified token claims, keyed by a hash of the token.
+
+    Entries expire after ttl seconds and never outlive the token's exp claim.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires, claims = entry
+        if time.time() >= expires:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return claims
+
+    def set(self, token: str, claims: dict):
+        expires = time.time() + self._ttl
+        if "exp" in claims:
+            expires = min(expires, float(claims["exp"]))
+
+        key = self._key(token)
+        self._entries[key] = (expires, claims)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class OIDCClient:
+    """Verifies ID tokens against the keys published by the OpenID provider.
+
+    The configuration and JWKS are fetched without blocking the event loop, at
+    start and then every refresh_interval seconds. A token signed with a key we
+    do not know yet triggers an early refresh, so key rotation is picked up.
+    """
+
+    # unknown key ids refresh the keys at most this often, in seconds
+    min_refresh_interval = 60
+
+    def __init__(
+        self,
+        configuration_url: str,
+        refresh_interval: int,
+        claims_cache: ClaimsCache,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        self._configuration_url = configuration_url
+        self._refresh_interval = refresh_interval
+        self._claims = claims_cache
+        self._http_client = http_client
+        self._configuration: dict | None = None
+        self._keys: dict[str | None, jwt.PyJWK] = {}
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except REFRESH_ERRORS:
+            logger.exception("Fetching the OpenID configuration failed")
+
+        self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self):
+        async with self._lock:
+            await self._refresh()
+
+    async def _refresh(self):
+        client = self._http_client or httpx.AsyncClient(timeout=10)
+        try:
+            response = await client.get(self._configuration_url)
+            response.raise_for_status()
+            configuration = response.json()
+
+            response = await client.get(configuration["jwks_uri"])
+            response.raise_for_status()
+            jwks = jwt.PyJWKSet.from_dict(response.json())
+        finally:
+            if self._http_client is None:
+                await client.aclose()
+
+        self._configuration = configuration
+        self._keys = {key.key_id: key for key in jwks.keys}
+        self._refreshed_at = time.monotonic()
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            try:
+                await self.refresh()
+            except REFRESH_ERRORS:
+                logger.exception("Refreshing the OpenID configuration failed")
+
+    async def _refresh_for_unknown_key(self, key_id: str | None):
+        async with self._lock:
+            # another request may have refreshed while we waited for the lock
+            if key_id in self._keys and self._configuration is not None:
+                return
+            if (
+                self._configuration is not None
+                and time.monotonic() - self._refreshed_at < self.min_refresh_interval
+            ):
+                return
+
+            await self._refresh()
+
+    def _find_key(self, key_id: str | None) -> jwt.PyJWK | None:
+        if key_id is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+
+        return self._keys.get(key_id)
+
+    async def verify(self, token: str) -> dict:
+        """The claims of a valid token, raises a PyJWTError otherwise."""
+        claims = self._claims.get(token)
+        if claims is not None:
+            return claims
+
+        key_id = jwt.get_unverified_header(token).get("kid")
+        key = self._find_key(key_id)
+        if key is None or self._configuration is None:
+            try:
+                await self._refresh_for_unknown_key(key_id)
+            except httpx.HTTPError as error:
+                raise jwt.exceptions.PyJWKClientConnectionError(str(error)) from error
+
+            key = self._find_key(key_id)
+            if key is None:
+                raise jwt.exceptions.PyJWKClientError("Unable to find a signing key")
+
+        claims = jwt.decode(
+            token,
+            key=key.key,
+            algorithms=self._configuration["id_token_signing_alg_values_supported"],
+            options={"verify_aud": False},
+        )
+        self._claims.set(token, claims)
+
+        return claims
+
+
+oidc_client = OIDCClient(
+    settings.openid_configuration,
+    settings.update_interval,
+    ClaimsCache(settings.token_cache_size, settings.token_cache_ttl),
+)
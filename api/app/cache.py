@@ -0,0 +1,145 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Protocol
+from uuid import UUID
+
+from app.conf import settings
+from app.signing import current_expiry
+
+ALBUMS = "albums"
+SMOELEN = "smoelen"
+
+
+def album(album_id: UUID) -> str:
+    return f"album:{album_id}"
+
+
+def smoel(smoel_id: UUID) -> str:
+    return f"smoel:{smoel_id}"
+
+
+class CacheBackend(Protocol):
+    """Storage for cached response bodies, grouped in namespaces.
+
+    Invalidating a namespace bumps its generation, a body is only stored when
+    the generation did not change while it was being loaded. A shared backend
+    (e.g. redis with a counter per namespace) only has to implement these.
+    """
+
+    async def generation(self, namespace: str) -> int: ...
+
+    async def get(self, namespace: str, key: str) -> bytes | None: ...
+
+    async def set(
+        self, namespace: str, key: str, value: bytes, generation: int, ttl: int
+    ): ...
+
+    async def invalidate(self, namespace: str): ...
+
+    async def clear(self): ...
+
+
+class MemoryBackend:
+    """Bounded LRU in this process, limited by the total size of the bodies."""
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[int, float, bytes]] = (
+            OrderedDict()
+        )
+        self._generations: dict[str, int] = {}
+
+    async def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    async def get(self, namespace: str, key: str) -> bytes | None:
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+
+        generation, expires, value = entry
+        if generation != self._generations.get(namespace, 0) or time.time() >= expires:
+            self._remove((namespace, key))
+            return None
+
+        self._entries.move_to_end((namespace, key))
+        return value
+
+    async def set(
+        self, namespace: str, key: str, value: bytes, generation: int, ttl: int
+    ):
+        # invalidated while loading, the value may already be outdated
+        if generation != self._generations.get(namespace, 0):
+            return
+        if len(value) > self._max_bytes:
+            return
+
+        self._remove((namespace, key))
+        self._entries[(namespace, key)] = (generation, time.time() + ttl, value)
+        self._size += len(value)
+        while self._size > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    async def invalidate(self, namespace: str):
+        # entries of older generations are dropped when they are next read
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    async def clear(self):
+        self._entries.clear()
+        self._generations.clear()
+        self._size = 0
+
+    def _remove(self, entry_key: tuple[str, str]):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._size -= len(entry[2])
+
+
+class ResponseCache:
+    """Serialized, pre-signed response bodies of the album and smoel endpoints.
+
+    Bodies are cached per namespace (the album list, a single album, ...) and
+    signing bucket, the crud functions invalidate the namespaces they change.
+    Smoelen are also tagged outside of this app, so entries expire after ttl.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self._ttl = ttl
+        # per kind of namespace, e.g. "album"
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    async def get(
+        self, namespace: str, key: str, load: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        # signed urls change with the bucket, so does the body
+        key = f"{key}|{current_expiry()}"
+        kind = namespace.split(":")[0]
+
+        value = await self.backend.get(namespace, key)
+        if value is not None:
+            self.hits[kind] += 1
+            return value
+
+        self.misses[kind] += 1
+        generation = await self.backend.generation(namespace)
+        value = await load()
+        await self.backend.set(namespace, key, value, generation, self._ttl)
+
+        return value
+
+    async def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            await self.backend.invalidate(namespace)
+
+    async def clear(self):
+        await self.backend.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+
+response_cache = ResponseCache(
+    MemoryBackend(settings.response_cache_bytes), settings.response_cache_ttl
+)
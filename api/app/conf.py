@@ -1,3 +1,5 @@
+import os
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,7 +12,66 @@ class Settings(BaseSettings):
     database_url: str
     client_id: str
     client_secret: str
+    # seconds between refreshes of the OpenID configuration and signing keys
     update_interval: int = 24 * 60 * 60
+    # verified tokens kept in memory, and for at most this many seconds
+    token_cache_size: int = 4096
+    token_cache_ttl: int = 5 * 60
+
+    # "hmac" or "rsa"; rsa reads data/private.key and data/public.key
+    signing_backend: str = "hmac"
+    signing_key_path: str = "data/signing.key"
+    # media urls share one expiry per bucket (aligned to midnight UTC for a day)
+    signature_bucket: int = 24 * 60 * 60
+    signature_cache_size: int = 65536
+    # items whose file paths are kept in memory for the media endpoints
+    media_cache_size: int = 65536
+    # "stream" serves media from python, "x-accel-redirect" (nginx) and
+    # "x-sendfile" only return a header and leave sending the file to the proxy
+    media_delivery: str = "stream"
+    # internal nginx location the data directory is aliased to
+    x_accel_redirect_prefix: str = "/internal/"
+    # internal nginx locations of storage roots outside the data directory, by
+    # root (e.g. {"/mnt/disk2/items": "/internal-disk2/"})
+    x_accel_redirect_locations: dict[str, str] = {}
+
+    # memory for serialized album and smoel responses, in bytes
+    response_cache_bytes: int = 256 * 1024 * 1024
+    # smoelen are tagged by another service, cached responses expire after this
+    response_cache_ttl: int = 5 * 60
+
+    # items per page when a cursor is given without a limit
+    page_size: int = 100
+
+    # worker processes generating covers and optimized files
+    processing_workers: int = os.cpu_count() or 1
+    # per file, in bytes
+    max_upload_size: int = 4 * 1024 * 1024 * 1024
+    # "local" keeps files in storage_roots, spread over them by content hash,
+    # "s3" in the bucket at s3_url (e.g. "https://media.s3.eu-west-1.amazonaws.com")
+    storage_backend: str = "local"
+    storage_roots: list[str] = ["data/items"]
+    s3_url: str = ""
+    s3_region: str = "us-east-1"
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    # resumable uploads not written to for this many seconds are removed
+    upload_ttl: int = 24 * 60 * 60
+    # uploads identical to an item in the album: "skip" rejects them, "link" adds
+    # an item sharing its files; identical items in other albums always share
+    duplicate_uploads: str = "skip"
+    # larger images are rejected, Pillow warns about decompression bombs at ~89M
+    max_image_pixels: int = 100_000_000
+    # widths of the scaled down copies made of every image
+    derivative_widths: list[int] = [200, 400, 800, 1600]
+    # stored next to every jpeg, in order of preference, e.g. ["avif", "webp"]
+    image_formats: list[str] = ["webp"]
+    # videos over either limit are re-encoded, others only get their streams
+    # copied; the height limits the short side, in pixels
+    video_max_bitrate: int = 12_000_000
+    video_max_height: int = 1080
+    # heights of the HLS renditions made of every video, e.g. [360, 720, 1080]
+    hls_renditions: list[int] = []
 
 
 settings = Settings()
@@ -1,135 +1,155 @@
+import asyncio
 import datetime
+import logging
 import os
-from functools import lru_cache
+from typing import Awaitable, Callable
 from uuid import uuid4, UUID
 
-import ffmpeg
-from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
-from PIL import Image
 from fastapi import UploadFile
-from sqlalchemy import select, func
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import case, delete, select, func, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession as Session
 from sqlalchemy.orm import selectinload
 
+from app import cache, processing
+from app.cache import response_cache
 from app.conf import settings
-from app.db import models, schemas
-from app.fileresponse import FastApiBaizeFileResponse as FileResponse
-
-
-@lru_cache()
-def get_signer():
-    with open("data/private.key", "r", encoding="utf8") as buffer:
-        key = buffer.read()
-
-    return PKCS1_v1_5.new(RSA.import_key(key))
-
-
-@lru_cache()
-def get_verifier():
-    with open("data/public.key", "r", encoding="utf8") as buffer:
-        key = buffer.read()
-
-    return PKCS1_v1_5.new(RSA.import_key(key))
-
-
-def sign_url(url: str) -> str:
-    signature = get_signer().sign(SHA256.new(url.encode("utf-8")))
-    return f"{url}?signature={signature.hex()}"
+from app.db import models, schemas, serializers
+from app.db.pagination import get_items_page
+from app.db.summaries import update_album_summaries
+from app.media import media_cache
+from app.signing import current_expiry
+from app.storage import remove_files, storage
+from app.uploads import (
+    PartialUpload,
+    UploadConflict,
+    UploadNotFound,
+    UploadRejected,
+    resumable_uploads,
+    stage_upload,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def sign_item(item_data: models.Item) -> schemas.Item:
-    item = schemas.Item.model_validate(item_data)
-    expiry = (datetime.datetime.now() + datetime.timedelta(days=1)).timestamp()
-
-    item.cover_path = sign_url(f"{settings.base_url}/items/{item.id}/{expiry}/cover")
-    item.path = sign_url(f"{settings.base_url}/items/{item.id}/{expiry}/full")
-
-    return item
+    return schemas.Item.model_validate(serializers.item(item_data, current_expiry()))
 
 
-async def get_album(db: Session, album_id: UUID) -> schemas.Album:
+async def get_album(
+    db: Session, album_id: UUID, limit: int | None = None, cursor: str | None = None
+) -> dict:
+    """The album in the shape of schemas.Album, items are signed."""
     result = await db.execute(
         select(models.Album)
         .where(models.Album.id == album_id)
-        .options(selectinload(models.Album.items).selectinload(models.Item.smoelen))
+        .options(selectinload(models.Album.preview).selectinload(models.Item.smoelen))
     )
     db_album = result.scalar_one()
-    album = schemas.Album.model_validate(db_album)
-    album.items = [sign_item(item) for item in album.items]
-
-    return album
-
-
-async def get_smoel_album(db: Session, smoel_id: UUID) -> schemas.SmoelAlbum:
-    result = await db.execute(
-        select(models.Smoel)
-        .where(models.Smoel.id == smoel_id)
-        .options(selectinload(models.Smoel.items))
+    query = (
+        select(models.Item)
+        .where(models.Item.album_id == album_id)
+        .options(selectinload(models.Item.smoelen))
     )
-    db_smoel = result.scalar_one()
-    smoel = schemas.SmoelAlbum.model_validate(db_smoel)
-    smoel.items = [sign_item(item) for item in smoel.items]
-
-    return smoel
 
+    if limit is None and cursor is None:
+        result = await db.execute(query.order_by(models.Item.date.desc()))
+        db_items, next_cursor = result.scalars().all(), None
+    else:
+        db_items, next_cursor = await get_items_page(
+            db, query, limit or settings.page_size, cursor
+        )
 
-async def get_full(db: Session, item_id: UUID) -> FileResponse:
-    result = await db.execute(select(models.Item).where(models.Item.id == item_id))
-    item = result.scalar_one()
+    return serializers.album(db_album, db_items, next_cursor, current_expiry())
 
-    return FileResponse(item.path)
 
+async def get_smoel_album(
+    db: Session, smoel_id: UUID, limit: int | None = None, cursor: str | None = None
+) -> dict:
+    """The smoel in the shape of schemas.SmoelAlbum, items are signed."""
+    result = await db.execute(select(models.Smoel).where(models.Smoel.id == smoel_id))
+    db_smoel = result.scalar_one()
+    query = (
+        select(models.Item)
+        .join(
+            models.association_table,
+            models.association_table.c.item_id == models.Item.id,
+        )
+        .where(models.association_table.c.smoel_id == smoel_id)
+        .options(selectinload(models.Item.smoelen))
+    )
 
-async def get_cover(db: Session, item_id: UUID) -> FileResponse:
-    result = await db.execute(select(models.Item).where(models.Item.id == item_id))
-    item = result.scalar_one()
+    if limit is None and cursor is None:
+        result = await db.execute(query.order_by(models.Item.date.desc()))
+        db_items, next_cursor = result.scalars().all(), None
+    else:
+        db_items, next_cursor = await get_items_page(
+            db, query, limit or settings.page_size, cursor
+        )
 
-    return FileResponse(item.cover_path)
+    return serializers.smoel_album(db_smoel, db_items, next_cursor, current_expiry())
 
 
-async def get_albums(db: Session) -> list[schemas.AlbumList]:
+async def get_albums(db: Session) -> list[dict]:
+    """Every album in the shape of schemas.AlbumList."""
     result = await db.execute(
         select(models.Album).options(
             selectinload(models.Album.preview).selectinload(models.Item.smoelen)
         )
     )
-    db_albums = result.scalars().all()
-    result_list = []
-
-    for db_album in db_albums:
-        album = schemas.AlbumList.model_validate(db_album)
-        if db_album.preview_id:
-            album.preview = sign_item(db_album.preview)
+    expiry = current_expiry()
 
-        result_list.append(album)
+    return [serializers.album_list(db_album, expiry) for db_album in result.scalars()]
 
-    return result_list
 
-
-async def get_smoelen_albums(db: Session) -> list[schemas.SmoelAlbumList]:
+async def get_smoelen_albums(db: Session) -> list[dict]:
+    """Every smoel in the shape of schemas.SmoelAlbumList, most tagged first."""
+    association = models.association_table
+    counts = (
+        select(association.c.smoel_id, func.count().label("count"))
+        .group_by(association.c.smoel_id)
+        .subquery()
+    )
     result = await db.execute(
-        select(models.Smoel).options(
-            selectinload(models.Smoel.preview), selectinload(models.Smoel.items)
+        select(models.Smoel)
+        .outerjoin(counts, counts.c.smoel_id == models.Smoel.id)
+        .order_by(func.coalesce(counts.c.count, 0).desc(), models.Smoel.name)
+        .options(selectinload(models.Smoel.preview).selectinload(models.Item.smoelen))
+    )
+    smoelen = result.scalars().all()
+
+    # the two most recent items of every smoel, ranked in the database
+    ranked = select(
+        association.c.item_id,
+        association.c.smoel_id,
+        func.row_number()
+        .over(
+            partition_by=association.c.smoel_id,
+            order_by=(models.Item.date.desc(), models.Item.id.desc()),
         )
+        .label("rank"),
+    ).join(models.Item, models.Item.id == association.c.item_id)
+    ranked = ranked.subquery()
+    result = await db.execute(
+        select(models.Item, ranked.c.smoel_id)
+        .join(ranked, ranked.c.item_id == models.Item.id)
+        .where(ranked.c.rank <= 2)
+        .order_by(ranked.c.smoel_id, ranked.c.rank)
+        .options(selectinload(models.Item.smoelen))
     )
-    smoelen = sorted(result.scalars().all(), key=lambda x: len(x.items), reverse=True)
-    result_list = []
+    recent = {}
+    for db_item, smoel_id in result.all():
+        recent.setdefault(smoel_id, []).append(db_item)
 
-    for smoel_data in smoelen:
-        smoel = schemas.SmoelAlbumList.model_validate(smoel_data)
-        if smoel_data.preview_id:
-            smoel.preview = sign_item(smoel_data.preview)
-        smoel.items = [sign_item(item) for item in smoel_data.items[:2]]
-        result_list.append(smoel)
-
-    return result_list
+    expiry = current_expiry()
+    return [
+        serializers.smoel_album_list(db_smoel, recent.get(db_smoel.id, []), expiry)
+        for db_smoel in smoelen
+    ]
 
 
 async def create_album(db: Session, album: schemas.AlbumCreate) -> models.Album:
     album_id = uuid4()
-    os.mkdir(f"data/items/{album_id}")
 
     result = await db.execute(select(func.count(models.Album.id)))
     total_albums = result.scalar_one()
@@ -138,6 +158,7 @@ async def create_album(db: Session, album: schemas.AlbumCreate) -> models.Album:
     )
     db.add(db_album)
     await db.commit()
+    await response_cache.invalidate(cache.ALBUMS)
     await db.refresh(db_album)
 
     return db_album
@@ -155,143 +176,341 @@ async def update_album(
     db_album.name = album.name
     db_album.description = album.description
     await db.commit()
+    await response_cache.invalidate(cache.ALBUMS, cache.album(album_id))
     await db.refresh(db_album)
 
     return db_album
 
 
-async def order_albums(db: Session, albums: list[schemas.AlbumOrder]):
-    for album in albums:
-        result = await db.execute(
-            select(models.Album).where(models.Album.id == album.id)
-        )
-        db_album = result.scalar_one()
-        db_album.order = album.order
-    await db.commit()
+class AlbumOrderConflict(Exception):
+    pass
+
+
+async def order_albums(db: Session, albums: list[schemas.AlbumOrder]) -> list[dict]:
+    """Store the new order of albums in a single statement.
+
+    Raises AlbumOrderConflict, without changing anything, when an album does
+    not exist or was reordered since the version given for it.
+    """
+    album_ids = {album.id for album in albums}
+    versions = {album.id: album.version for album in albums}
     result = await db.execute(
-        select(models.Album).options(
-            selectinload(models.Album.preview).selectinload(models.Item.smoelen)
+        update(models.Album)
+        .where(
+            models.Album.id.in_(album_ids),
+            models.Album.version == case(versions, value=models.Album.id),
+        )
+        .values(
+            order=case(
+                {album.id: album.order for album in albums}, value=models.Album.id
+            ),
+            version=models.Album.version + 1,
         )
+        .execution_options(synchronize_session=False)
     )
-    return result.scalars().all()
+    if result.rowcount != len(album_ids):
+        await db.rollback()
+        raise AlbumOrderConflict()
+
+    await db.commit()
+    await response_cache.invalidate(cache.ALBUMS)
+    return await get_albums(db)
 
 
 async def delete_album(db: Session, album_id: UUID):
     # Get the album first to check if it exists
-    result = await db.execute(
-        select(models.Album)
-        .where(models.Album.id == album_id)
-        .options(selectinload(models.Album.items))
-    )
-    db_album = result.scalar_one_or_none()
+    db_album = await db.get(models.Album, album_id)
     if not db_album:
         return None
 
-    # Get all items in the album to delete them first
-    album_items = [item.id for item in db_album.items]
-
     # Delete all items in the album if there are any (this handles file cleanup too)
+    result = await db.execute(
+        select(models.Item.id).where(models.Item.album_id == album_id)
+    )
+    album_items = result.scalars().all()
     if album_items:
-        await delete_items(db, None, db_album.id, album_items)
-
-    # Remove the album directory
-    album_folder = f"data/items/{db_album.id}"
-    if os.path.exists(album_folder):
-        os.rmdir(album_folder)
+        await delete_items(db, None, None, album_items)
 
     # Delete the album from database
-    await db.delete(db_album)
+    await db.execute(delete(models.Album).where(models.Album.id == album_id))
     await db.commit()
+    await response_cache.invalidate(cache.ALBUMS, cache.album(album_id))
+
+    # albums used to have a folder of their own
+    album_folder = f"data/items/{album_id}"
+    if os.path.exists(album_folder):
+        await asyncio.to_thread(remove_files, set(), {album_folder})
 
     return True
 
 
-async def create_item(
-    db: Session,
+def item_type(content_type: str | None) -> models.Type:
+    file_type = (content_type or "").split("/")[0]
+    if file_type not in ["image", "video"]:
+        raise UploadRejected("Unsupported file type")
+
+    if file_type == "image":
+        return models.Type.IMAGE
+    return models.Type.VIDEO
+
+
+async def stage_item(
     user: schemas.User | None,
-    item: bytes,
-    content_type: str,
+    item: UploadFile,
     album_id: UUID | None,
     date: datetime = None,
-):
-    # write temp file
-    item_id = uuid4()
-    if album_id is None:
-        album_folder = "data/items/smoelen"
-        if not os.path.exists(album_folder):
-            os.mkdir(album_folder)
-
-    else:
-        album_folder = f"data/items/{album_id}"
+) -> models.Item:
+    """Store an upload and read its dimensions, the row is not added to a session.
 
-    os.mkdir(f"{album_folder}/{item_id}")
-    with open(f"/tmp/{item_id}", "wb") as buffer:
-        buffer.write(item)
+    Raises UploadRejected when the file can not be used, nothing is left on disk.
+    """
 
-    # get type
-    file_type = content_type.split("/")[0]
-    if file_type not in ["image", "video"]:
-        return None
+    async def store(path: str) -> str:
+        return await stage_upload(item, path, settings.max_upload_size)
 
-    if file_type == "image":
-        file_type = models.Type.IMAGE
-    else:
-        file_type = models.Type.VIDEO
+    return await stage_original(user, item.content_type, album_id, store, date)
 
-    # get metadata
-    if file_type == models.Type.IMAGE:
-        with Image.open(f"/tmp/{item_id}") as img:
-            width, height = img.size
 
-            # create cover image
-            cover_path = f"{album_folder}/{item_id}/cover.jpg"
-            img.thumbnail((400, 400 * height // width))
-            img.save(cover_path)
-    else:
-        probe = ffmpeg.probe(f"/tmp/{item_id}")
-        width = probe["streams"][0]["width"]
-        height = probe["streams"][0]["height"]
-
-        # create cover image
-        cover_path = f"{album_folder}/{item_id}/cover.jpg"
-        stream = ffmpeg.input(f"/tmp/{item_id}")
-        stream = ffmpeg.filter(stream, "scale", 400, -1)
-        stream = ffmpeg.output(stream, cover_path, vframes=1)
-        ffmpeg.run(stream)
-
-    # store optimized full size image/video
-    if file_type == models.Type.VIDEO:
-        path = f"{album_folder}/{item_id}/item.mp4"
-
-        stream = ffmpeg.input(f"/tmp/{item_id}")
-        stream = ffmpeg.output(stream, path, crf=23)
-        ffmpeg.run(stream)
-    else:
-        path = f"{album_folder}/{item_id}/item.jpg"
-        with Image.open(f"/tmp/{item_id}") as img:
-            img.save(path)
+async def stage_original(
+    user: schemas.User | None,
+    content_type: str | None,
+    album_id: UUID | None,
+    store: Callable[[str], Awaitable[str]],
+    date: datetime = None,
+) -> models.Item:
+    """Like stage_item, store writes the original to the path it is given.
+
+    store returns the sha256 hex digest of what it wrote. UploadNotFound and
+    UploadConflict raised by store are passed on, other errors reject the file.
+    """
+    file_type = item_type(content_type)
+
+    # staged locally, resolve_duplicates moves it to storage unless the content
+    # is already stored; covers and optimized files are created by the worker
+    path = resumable_uploads.temporary_path()
+    try:
+        content_hash = await store(path)
+        size = os.path.getsize(path)
+
+        # get metadata
+        if file_type == models.Type.IMAGE:
+            width, height = await run_in_threadpool(
+                processing.probe_image, path, settings.max_image_pixels
+            )
+        else:
+            width, height = await run_in_threadpool(processing.probe_video, path)
+    except (UploadRejected, UploadNotFound, UploadConflict):
+        # a resumable upload that could not be taken is left as it was
+        await run_in_threadpool(remove_staged, path)
+        raise
+    except processing.ImageTooLarge as error:
+        await run_in_threadpool(remove_staged, path)
+        raise UploadRejected("Image is too large") from error
+    except Exception as error:
+        await run_in_threadpool(remove_staged, path)
+        raise UploadRejected("Could not read file") from error
 
     if user:
         user_id = user.id
     else:
         user_id = None
 
-    db_item = models.Item(
-        id=item_id,
+    # until processed the original is served for both the cover and full item
+    return models.Item(
+        id=uuid4(),
         user=user_id,
         album_id=album_id,
         type=file_type,
         width=width,
         height=height,
-        cover_path=cover_path,
+        cover_path=path,
         path=path,
         date=date,
+        processed=False,
+        content_hash=content_hash,
+        size=size,
+    )
+
+
+def remove_staged(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# the columns of an item that describe its stored files
+FILE_COLUMNS = (
+    "path",
+    "cover_path",
+    "processed",
+    "width",
+    "height",
+    "widths",
+    "formats",
+    "hls",
+    "size",
+)
+
+
+async def store_original(db_item: models.Item) -> str:
+    """Move the staged original of the item to storage, returns its key.
+
+    The key is unique to the item, rolling back removes only this copy even
+    when another request stored the same content at the same time.
+    """
+    key = f"{storage.folder(db_item.content_hash)}/{db_item.id}/original"
+    await storage.save(db_item.path, key)
+    db_item.path = db_item.cover_path = key
+    return key
+
+
+async def resolve_duplicates(
+    db: Session,
+    album_id: UUID | None,
+    staged: list[tuple[str | None, models.Item]],
+) -> tuple[list[models.Item], list[schemas.UploadFailure], set[str]]:
+    """Store the staged uploads, unless an item with the same content is stored.
+
+    Files are stored once per content whatever album it is in. A duplicate
+    within the album is rejected when settings.duplicate_uploads is "skip".
+    Other duplicates keep their staged file, link_duplicates shares the files
+    with them once they are inserted. Also returns the keys of the originals
+    that were stored.
+    """
+    result = await db.execute(
+        select(models.Item).where(
+            models.Item.content_hash.in_(
+                [db_item.content_hash for _, db_item in staged]
+            ),
+        )
+    )
+    by_hash = {}
+    in_album = set()
+    for db_item in result.scalars():
+        by_hash.setdefault(db_item.content_hash, db_item)
+        if db_item.album_id == album_id:
+            in_album.add(db_item.content_hash)
+
+    db_items = []
+    failures = []
+    stored = {}
+    for filename, db_item in staged:
+        content_hash = db_item.content_hash
+        original = by_hash.get(content_hash)
+        if original is None:
+            stored[content_hash] = db_item
+            # later copies within the same batch are duplicates of this one
+            by_hash[content_hash] = db_item
+            in_album.add(content_hash)
+            db_items.append(db_item)
+            continue
+
+        if content_hash in in_album and settings.duplicate_uploads == "skip":
+            await run_in_threadpool(remove_staged, db_item.path)
+            failures.append(
+                schemas.UploadFailure(
+                    filename=filename, detail="Duplicate of an existing item"
+                )
+            )
+            continue
+
+        in_album.add(content_hash)
+        db_items.append(db_item)
+
+    keys = set()
+    for db_item in stored.values():
+        keys.add(await store_original(db_item))
+    for db_item in db_items:
+        original = stored.get(db_item.content_hash)
+        if original is not None and original is not db_item:
+            await run_in_threadpool(remove_staged, db_item.path)
+            for column in FILE_COLUMNS:
+                setattr(db_item, column, getattr(original, column))
+
+    return db_items, failures, keys
+
+
+async def link_duplicates(db: Session, db_items: list[models.Item]) -> set[str]:
+    """Share the files of stored items with the duplicates among db_items.
+
+    Runs once db_items are flushed, so the transaction holds the write lock and
+    the originals are read as committed: the worker can not replace their files
+    and delete_items can not remove them before this transaction ends. Content
+    that was deleted since resolve_duplicates is stored after all. Returns the
+    keys of the originals that were stored.
+    """
+    pending = [
+        db_item for db_item in db_items if resumable_uploads.is_temporary(db_item.path)
+    ]
+    if not pending:
+        return set()
+
+    result = await db.execute(
+        select(models.Item)
+        .where(
+            models.Item.content_hash.in_({db_item.content_hash for db_item in pending}),
+            models.Item.id.not_in([db_item.id for db_item in db_items]),
+        )
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    by_hash = {}
+    for original in result.scalars():
+        by_hash.setdefault(original.content_hash, original)
+
+    keys = set()
+    for db_item in pending:
+        original = by_hash.get(db_item.content_hash)
+        if original is None:
+            keys.add(await store_original(db_item))
+            by_hash[db_item.content_hash] = db_item
+            continue
+
+        await run_in_threadpool(remove_staged, db_item.path)
+        for column in FILE_COLUMNS:
+            setattr(db_item, column, getattr(original, column))
+
+    return keys
+
+
+async def create_item(
+    db: Session,
+    user: schemas.User | None,
+    item: UploadFile,
+    album_id: UUID | None,
+    date: datetime = None,
+) -> models.Item:
+    db_item = await stage_item(user, item, album_id, date)
+    return await add_item(db, album_id, item.filename, db_item)
+
+
+async def add_item(
+    db: Session, album_id: UUID | None, filename: str | None, db_item: models.Item
+) -> models.Item:
+    """Insert a staged item, raises UploadRejected for a skipped duplicate."""
+    db_items, failures, stored = await resolve_duplicates(
+        db, album_id, [(filename, db_item)]
     )
+    if failures:
+        raise UploadRejected(failures[0].detail)
+
+    db_item = db_items[0]
     db.add(db_item)
-    await db.commit()
+    try:
+        await db.flush()
+        stored |= await link_duplicates(db, db_items)
+        await update_album_summaries(db, [(album_id, db_item.type, db_item.size)])
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await storage.delete(stored)
+        raise
+    if album_id is not None:
+        await response_cache.invalidate(cache.ALBUMS, cache.album(album_id))
     await db.refresh(db_item)
+    await db.refresh(db_item, ["smoelen"])
 
-    os.remove(f"/tmp/{item_id}")
     return db_item
 
 
@@ -301,47 +520,221 @@ async def create_items(
     items: list[UploadFile],
     album_id: UUID | None,
     date: datetime = None,
-) -> list[models.Item]:
+) -> tuple[list[models.Item], list[schemas.UploadFailure]]:
     # Check if the album exists
-    album = await db.get_one(models.Album, album_id)
-    db_items = []
-    for item in items:
-        db_item = await create_item(
-            db, user, await item.read(), item.content_type, album.id, date
+    await db.get_one(models.Album, album_id)
+
+    # files are staged concurrently, a rejected file does not affect the others
+    results = await asyncio.gather(
+        *(stage_item(user, item, album_id, date) for item in items),
+        return_exceptions=True,
+    )
+    staged = []
+    failures = []
+    for item, result in zip(items, results):
+        if isinstance(result, UploadRejected):
+            failures.append(
+                schemas.UploadFailure(filename=item.filename, detail=str(result))
+            )
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            staged.append((item.filename, result))
+
+    db_items, duplicates, stored = await resolve_duplicates(db, album_id, staged)
+    failures.extend(duplicates)
+    if not db_items:
+        return [], failures
+
+    # all rows are inserted in a single transaction
+    item_ids = [db_item.id for db_item in db_items]
+    db.add_all(db_items)
+    try:
+        await db.flush()
+        stored |= await link_duplicates(db, db_items)
+        await update_album_summaries(
+            db, [(album_id, db_item.type, db_item.size) for db_item in db_items]
         )
-        if db_item is not None:
-            db_items.append(db_item)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await storage.delete(stored)
+        raise
+    await response_cache.invalidate(cache.ALBUMS, cache.album(album_id))
+
+    result = await db.execute(
+        select(models.Item)
+        .where(models.Item.id.in_(item_ids))
+        .order_by(models.Item.date.desc())
+        .options(selectinload(models.Item.smoelen))
+    )
+
+    return list(result.scalars().all()), failures
+
+
+async def create_upload(
+    db: Session, user: schemas.User, upload: schemas.UploadCreate
+) -> PartialUpload:
+    await db.get_one(models.Album, upload.album_id)
+    item_type(upload.content_type)
+
+    return await resumable_uploads.create(
+        upload.album_id, user.id, upload.filename, upload.content_type, upload.size
+    )
+
+
+async def finish_upload(
+    db: Session, user: schemas.User, upload_id: UUID
+) -> tuple[list[models.Item], list[schemas.UploadFailure]]:
+    """Turn a complete resumable upload into an item, like create_items."""
+    upload = resumable_uploads.get(upload_id, user.id)
+    if upload.offset != upload.size:
+        raise UploadConflict(f"Upload is at offset {upload.offset}")
+    # the album can have been deleted while the upload was sent
+    await db.get_one(models.Album, upload.album_id)
+
+    async def store(path: str) -> str:
+        return await resumable_uploads.take(upload_id, user.id, path)
+
+    try:
+        db_item = await stage_original(
+            user, upload.content_type, upload.album_id, store
+        )
+        db_item = await add_item(db, upload.album_id, upload.filename, db_item)
+    except UploadRejected as error:
+        return [], [schemas.UploadFailure(filename=upload.filename, detail=str(error))]
+
+    return [db_item], []
+
+
+async def cached_namespaces(db: Session, item_ids: list[UUID]) -> set[str]:
+    """The response cache namespaces that show any of the items."""
+    association = models.association_table
+    result = await db.execute(
+        select(models.Item.album_id).where(models.Item.id.in_(item_ids)).distinct()
+    )
+    namespaces = {cache.album(album_id) for album_id in result.scalars() if album_id}
+    # any of them can be an album preview
+    namespaces.add(cache.ALBUMS)
 
-    return db_items
+    result = await db.execute(
+        select(association.c.smoel_id)
+        .where(association.c.item_id.in_(item_ids))
+        .union(select(models.Smoel.id).where(models.Smoel.preview_id.in_(item_ids)))
+    )
+    smoel_ids = result.scalars().all()
+    if smoel_ids:
+        namespaces.add(cache.SMOELEN)
+        namespaces.update(cache.smoel(smoel_id) for smoel_id in smoel_ids)
+
+    return namespaces
 
 
 async def delete_items(
     db: Session, user: schemas.User | None, album_id: UUID | None, items: list[UUID]
-) -> schemas.Album | None:
-    # Check if the album exists
-    db_album = None
-    if album_id:
-        db_album = await db.get(models.Album, album_id)
-    # First delete the items
-    for item_id in items:
-        db_item = await db.get(models.Item, item_id)
-        if user is not None and db_item.user != user.id and not user.admin:
+) -> dict | None:
+    query = select(models.Item).where(models.Item.id.in_(items))
+    if user is not None and not user.admin:
+        query = query.where(models.Item.user == user.id)
+    result = await db.execute(query)
+    db_items = result.scalars().all()
+    deleted = [
+        (
+            db_item.id,
+            db_item.path,
+            db_item.cover_path,
+            db_item.widths,
+            db_item.formats,
+            db_item.hls,
+        )
+        for db_item in db_items
+    ]
+    summary = [(db_item.album_id, db_item.type, db_item.size) for db_item in db_items]
+    item_ids = [item_id for item_id, *_ in deleted]
+
+    referenced = set()
+    namespaces = set()
+    if item_ids:
+        association = models.association_table
+        namespaces = await cached_namespaces(db, item_ids)
+        await db.execute(delete(association).where(association.c.item_id.in_(item_ids)))
+        for model in (models.Album, models.Smoel):
+            await db.execute(
+                update(model)
+                .where(model.preview_id.in_(item_ids))
+                .values(preview_id=None)
+            )
+        await db.execute(delete(models.Item).where(models.Item.id.in_(item_ids)))
+        await update_album_summaries(db, summary, removed=True)
+
+        # duplicate uploads can share files, keep those other items still refer to
+        paths = set()
+        for _, path, cover_path, *_ in deleted:
+            paths.update((path, cover_path))
+        result = await db.execute(
+            select(models.Item.path, models.Item.cover_path).where(
+                or_(models.Item.path.in_(paths), models.Item.cover_path.in_(paths))
+            )
+        )
+        referenced = {path for row in result for path in row}
+    await db.commit()
+    await response_cache.invalidate(*namespaces)
+
+    # the rows are gone first, a file that fails to be removed is only logged
+    files = set()
+    for item_id, path, cover_path, widths, formats, hls in deleted:
+        media_cache.invalidate(item_id)
+        # unprocessed items use the original for both paths
+        if {path, cover_path} & referenced:
             continue
 
-        os.remove(db_item.path)
-        os.remove(db_item.cover_path)
-
-        album_folder = "data/items/smoelen"
-        if db_album:
-            album_folder = f"data/items/{db_album.id}"
-        os.rmdir(f"{album_folder}/{db_item.id}")
-        await db.delete(db_item)
-    await db.commit()
+        files.update(processing.stored_files(path, cover_path, widths, formats, hls))
+    if files:
+        await storage.delete(files)
 
     # Return the full album
     return await get_album(db, album_id) if album_id else None
 
 
+async def move_items(
+    db: Session, album_id: UUID, target_id: UUID, items: list[UUID]
+) -> dict:
+    """Move items of the album to the target album, their files stay where they are."""
+    await db.get_one(models.Album, target_id)
+    result = await db.execute(
+        select(models.Item.id, models.Item.type, models.Item.size).where(
+            models.Item.album_id == album_id, models.Item.id.in_(items)
+        )
+    )
+    moved = result.all()
+    item_ids = [item_id for item_id, _, _ in moved]
+
+    if item_ids and target_id != album_id:
+        await db.execute(
+            update(models.Item)
+            .where(models.Item.id.in_(item_ids))
+            .values(album_id=target_id)
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            update(models.Album)
+            .where(models.Album.id == album_id, models.Album.preview_id.in_(item_ids))
+            .values(preview_id=None)
+        )
+        await update_album_summaries(
+            db, [(album_id, type_, size) for _, type_, size in moved], removed=True
+        )
+        await update_album_summaries(
+            db, [(target_id, type_, size) for _, type_, size in moved]
+        )
+        await db.commit()
+        await response_cache.invalidate(
+            cache.ALBUMS, cache.album(album_id), cache.album(target_id)
+        )
+
+    return await get_album(db, album_id)
+
+
 async def set_preview(db: Session, album_id: UUID, item_id: UUID):
     result = await db.execute(select(models.Album).where(models.Album.id == album_id))
     db_album = result.scalar_one()
@@ -352,5 +745,11 @@ async def set_preview(db: Session, album_id: UUID, item_id: UUID):
 
     db_album.preview = db_item
     await db.commit()
+    await response_cache.invalidate(cache.ALBUMS, cache.album(album_id))
 
     return db_album
+
+
+async def get_item_status(db: Session, item_id: UUID) -> models.Item:
+    result = await db.execute(select(models.Item).where(models.Item.id == item_id))
+    return result.scalar_one()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import datetime
 import enum
 from typing import List
 
@@ -10,9 +11,12 @@ from sqlalchemy import (
     Uuid,
     Enum,
     Integer,
+    BigInteger,
     DateTime,
     Boolean,
     Table,
+    Index,
+    JSON,
 )
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import relationship
@@ -33,6 +37,14 @@ class Album(Base):
     name = Column(String)
     description = Column(String)
     order = Column(Integer)
+    # bumped by every reorder, so concurrent reorders can be detected
+    version = Column(Integer, server_default="0", nullable=False)
+    # kept up to date on upload, processing and delete, see app.db.summaries
+    item_count = Column(Integer, server_default="0", nullable=False)
+    image_count = Column(Integer, server_default="0", nullable=False)
+    video_count = Column(Integer, server_default="0", nullable=False)
+    total_bytes = Column(BigInteger, server_default="0", nullable=False)
+    newest_date = Column(DateTime(timezone=True), nullable=True)
     preview_id = Column(Uuid, ForeignKey("items.id"), nullable=True)
     preview = relationship("Item", foreign_keys=[preview_id])
 
@@ -49,6 +61,9 @@ association_table = Table(
     Base.metadata,
     Column("item_id", Uuid, ForeignKey("items.id")),
     Column("smoel_id", Uuid, ForeignKey("smoelen.id")),
+    # an item is tagged with a smoel at most once, this also serves item lookups
+    Index("ix_association_item_id_smoel_id", "item_id", "smoel_id", unique=True),
+    Index("ix_association_smoel_id_item_id", "smoel_id", "item_id"),
 )
 
 
@@ -67,12 +82,22 @@ class Smoel(Base):
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        # albums list their items newest first, scanned backwards by SQLite
+        Index("ix_items_album_id_date_id", "album_id", "date", "id"),
+    )
 
     id = Column(Uuid, primary_key=True, index=True)
     user = Column(String)
     album_id = Column(Uuid, ForeignKey("albums.id"), nullable=True)
     album = relationship("Album", back_populates="items", foreign_keys=[album_id])
-    date = Column(DateTime(timezone=True), server_default=func.now())
+    # set here rather than by the database, SQLite would store its own dates in
+    # another text format and pagination compares them as text
+    date = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.datetime.now(datetime.timezone.utc),
+        server_default=func.now(),
+    )
 
     processed = Column(Boolean, server_default=expression.false(), nullable=False)
     smoelen: Mapped[List[Smoel]] = relationship(
@@ -85,3 +110,13 @@ class Item(Base):
 
     cover_path = Column(String)
     path = Column(String)
+    # sha256 of the uploaded file, used to detect duplicate uploads
+    content_hash = Column(String(64), nullable=True, index=True)
+    # widths of the scaled down copies stored next to the full image
+    widths = Column(JSON, nullable=True)
+    # image formats stored next to every jpeg, e.g. ["webp"]
+    formats = Column(JSON, nullable=True)
+    # HLS segments per rendition height, e.g. {"360": 12}, for videos only
+    hls = Column(JSON, nullable=True)
+    # bytes stored for the item, linked duplicates count the shared files too
+    size = Column(BigInteger, nullable=True)
@@ -0,0 +1,53 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import Select, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession as Session
+
+from app.db import models
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(item: models.Item) -> str:
+    value = f"{item.date.isoformat()}|{item.id}"
+    return urlsafe_b64encode(value.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Raises InvalidCursor for cursors that were not produced by encode_cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        date, item_id = value.split("|")
+        return datetime.fromisoformat(date), UUID(item_id)
+    except (UnicodeError, ValueError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+async def get_items_page(
+    db: Session, query: Select, limit: int, cursor: str | None
+) -> tuple[list[models.Item], str | None]:
+    """Fetch one page of a newest-first item query, keyed on (date, id)."""
+    query = query.order_by(models.Item.date.desc(), models.Item.id.desc())
+    if cursor is not None:
+        date, item_id = decode_cursor(cursor)
+        # the cursor item may have been deleted since, only its values are used
+        query = query.where(
+            tuple_(models.Item.date, models.Item.id)
+            < tuple_(
+                literal(date, models.Item.date.type),
+                literal(item_id, models.Item.id.type),
+            )
+        )
+
+    result = await db.execute(query.limit(limit + 1))
+    items = list(result.scalars().all())
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    return items, encode_cursor(items[-1])
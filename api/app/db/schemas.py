@@ -1,24 +1,7 @@
 from datetime import datetime
-from functools import lru_cache
 from uuid import UUID
 
-from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
-from pydantic import BaseModel
-
-
-@lru_cache()
-def get_signer():
-    with open("private.key", "r", encoding="utf8") as buffer:
-        key = buffer.read()
-
-    return PKCS1_v1_5.new(RSA.import_key(key))
-
-
-def sign_url(url: str):
-    signature = get_signer().sign(SHA256.new(url.encode("utf-8")))
-    return f"{url}?signature={signature.hex()}"
+from pydantic import BaseModel, Field
 
 
 class Smoel(BaseModel):
@@ -37,10 +20,61 @@ class ItemBase(BaseModel):
     user: str | None
 
 
+class ItemSource(BaseModel):
+    width: int
+    url: str
+
+
 class Item(ItemBase):
     path: str
     cover_path: str
+    processed: bool
     smoelen: list[Smoel]
+    # signed urls of the available sizes, smallest first, ending with the full item
+    srcset: list[ItemSource] = []
+    # master playlist, for videos with HLS renditions
+    hls: str | None = None
+
+    model_config = {"from_attributes": True}
+
+
+class ItemStatus(BaseModel):
+    id: UUID
+    processed: bool
+
+    model_config = {"from_attributes": True}
+
+
+class UploadFailure(BaseModel):
+    filename: str | None
+    detail: str
+
+
+class UploadResult(BaseModel):
+    items: list[Item]
+    failed: list[UploadFailure]
+
+
+class ItemMove(BaseModel):
+    # the album the items are moved to
+    album_id: UUID
+    items: list[UUID]
+
+
+class UploadCreate(BaseModel):
+    album_id: UUID
+    filename: str | None = None
+    content_type: str
+    # in bytes, chunks are appended until the upload has this size
+    size: int = Field(ge=0)
+
+
+class Upload(BaseModel):
+    id: UUID
+    offset: int
+    size: int
+    # removed when no chunk is written before this time
+    expires: datetime
 
     model_config = {"from_attributes": True}
 
@@ -63,6 +97,7 @@ class Album(AlbumBase):
     items: list[Item]
     order: int
     preview: Item | None
+    next: str | None = None
 
     model_config = {"from_attributes": True}
 
@@ -70,6 +105,7 @@ class Album(AlbumBase):
 class SmoelAlbum(SmoelAlbumBase):
     id: UUID
     items: list[Item]
+    next: str | None = None
 
     model_config = {"from_attributes": True}
 
@@ -77,6 +113,12 @@ class SmoelAlbum(SmoelAlbumBase):
 class AlbumList(AlbumBase):
     id: UUID
     order: int
+    version: int
+    item_count: int
+    image_count: int
+    video_count: int
+    total_bytes: int
+    newest_date: datetime | None
     preview: Item | None
 
     model_config = {"from_attributes": True}
@@ -93,6 +135,8 @@ class SmoelAlbumList(SmoelAlbumBase):
 class AlbumOrder(BaseModel):
     id: UUID
     order: int
+    # the version the order was based on, a stale one is a conflict
+    version: int
 
 
 class User(BaseModel):
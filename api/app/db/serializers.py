@@ -0,0 +1,112 @@
+"""JSON-ready dicts in the shape of app.db.schemas, built straight from ORM rows.
+
+The album endpoints return thousands of items, validating each through pydantic
+only to serialize it again took most of the request. These skip validation and
+are dumped with orjson, tests/test_serializers.py keeps them in line with the
+schemas.
+"""
+
+import orjson
+
+from app.db import models
+from app.media import media_cache
+from app.signing import sign_item_url
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value)
+
+
+def item(db_item: models.Item, expiry: float) -> dict:
+    # the urls are about to be requested, keep their files at hand
+    media_cache.prime(db_item)
+
+    item_id = db_item.id
+    width = int(db_item.width)
+    path = sign_item_url(item_id, expiry, "full")
+    srcset = [
+        {"width": w, "url": sign_item_url(item_id, expiry, f"w/{w}")}
+        for w in db_item.widths or []
+    ]
+    srcset.append({"width": width, "url": path})
+
+    return {
+        "id": item_id,
+        "date": db_item.date,
+        "width": width,
+        "height": int(db_item.height),
+        "type": db_item.type.value,
+        "user": db_item.user,
+        "path": path,
+        "cover_path": sign_item_url(item_id, expiry, "cover"),
+        "processed": bool(db_item.processed),
+        "smoelen": [
+            {"id": db_smoel.id, "name": db_smoel.name} for db_smoel in db_item.smoelen
+        ],
+        "srcset": srcset,
+        "hls": (
+            sign_item_url(item_id, expiry, "hls/master.m3u8") if db_item.hls else None
+        ),
+    }
+
+
+def preview(db_item: models.Item | None, expiry: float) -> dict | None:
+    return item(db_item, expiry) if db_item is not None else None
+
+
+def album(
+    db_album: models.Album,
+    db_items: list[models.Item],
+    next_cursor: str | None,
+    expiry: float,
+) -> dict:
+    return {
+        "name": db_album.name,
+        "description": db_album.description,
+        "id": db_album.id,
+        "items": [item(db_item, expiry) for db_item in db_items],
+        "order": db_album.order,
+        "preview": preview(db_album.preview, expiry),
+        "next": next_cursor,
+    }
+
+
+def album_list(db_album: models.Album, expiry: float) -> dict:
+    return {
+        "name": db_album.name,
+        "description": db_album.description,
+        "id": db_album.id,
+        "order": db_album.order,
+        "version": db_album.version,
+        "item_count": db_album.item_count,
+        "image_count": db_album.image_count,
+        "video_count": db_album.video_count,
+        "total_bytes": db_album.total_bytes,
+        "newest_date": db_album.newest_date,
+        "preview": preview(db_album.preview, expiry),
+    }
+
+
+def smoel_album(
+    db_smoel: models.Smoel,
+    db_items: list[models.Item],
+    next_cursor: str | None,
+    expiry: float,
+) -> dict:
+    return {
+        "name": db_smoel.name,
+        "id": db_smoel.id,
+        "items": [item(db_item, expiry) for db_item in db_items],
+        "next": next_cursor,
+    }
+
+
+def smoel_album_list(
+    db_smoel: models.Smoel, db_items: list[models.Item], expiry: float
+) -> dict:
+    return {
+        "name": db_smoel.name,
+        "id": db_smoel.id,
+        "preview": preview(db_smoel.preview, expiry),
+        "items": [item(db_item, expiry) for db_item in db_items],
+    }
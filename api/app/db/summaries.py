@@ -0,0 +1,62 @@
+from collections import defaultdict
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession as Session
+
+from app.db import models
+
+
+async def update_album_summaries(
+    db: Session,
+    items: Iterable[tuple[UUID | None, models.Type, int | None]],
+    removed: bool = False,
+):
+    """Add (album_id, type, size) of new items to their album's counts.
+
+    With removed the items are subtracted instead. Call this after the rows
+    were inserted or deleted, the newest date is read back from the
+    (album_id, date, id) index rather than recounted.
+    """
+    sign = -1 if removed else 1
+    changes = defaultdict(lambda: {"items": 0, "images": 0, "videos": 0, "bytes": 0})
+    for album_id, file_type, size in items:
+        if album_id is None:
+            continue
+
+        change = changes[album_id]
+        change["items"] += sign
+        change["images" if file_type == models.Type.IMAGE else "videos"] += sign
+        change["bytes"] += sign * (size or 0)
+
+    for album_id, change in changes.items():
+        newest = (
+            select(func.max(models.Item.date))
+            .where(models.Item.album_id == album_id)
+            .scalar_subquery()
+        )
+        await db.execute(
+            update(models.Album)
+            .where(models.Album.id == album_id)
+            .values(
+                item_count=models.Album.item_count + change["items"],
+                image_count=models.Album.image_count + change["images"],
+                video_count=models.Album.video_count + change["videos"],
+                total_bytes=models.Album.total_bytes + change["bytes"],
+                newest_date=newest,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def add_album_bytes(db: Session, album_id: UUID | None, size: int):
+    if album_id is None or not size:
+        return
+
+    await db.execute(
+        update(models.Album)
+        .where(models.Album.id == album_id)
+        .values(total_bytes=models.Album.total_bytes + size)
+        .execution_options(synchronize_session=False)
+    )
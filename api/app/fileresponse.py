@@ -1,6 +1,64 @@
+import os
+from email.utils import parsedate_to_datetime
+from mimetypes import guess_type
+from urllib.parse import quote
+
+from baize.asgi.helper import send_http_body, send_http_start
 from baize.asgi.responses import FileResponse as BaizeFileResponse
+from baize.typing import Receive, Scope, Send
 from fastapi.responses import Response as FastApiResponse
 
+# headers a 304 response repeats from the full response
+NOT_MODIFIED_HEADERS = ("cache-control", "etag", "expires", "last-modified", "vary")
+
+
+class ConditionalFileResponse(BaizeFileResponse):
+    """Baize's FileResponse with strong ETags that answers conditional requests."""
+
+    @staticmethod
+    def generate_etag(stat_result: os.stat_result) -> str:
+        return (
+            f"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}"
+            f"-{stat_result.st_size:x}"
+        )
+
+    def is_not_modified(self, scope: Scope) -> bool:
+        headers = dict(scope["headers"])
+        if b"if-none-match" in headers:
+            # If-None-Match takes precedence and uses the weak comparison
+            etags = headers[b"if-none-match"].decode("latin-1")
+            if etags.strip() == "*":
+                return True
+
+            etag = self.headers["etag"]
+            return any(
+                tag.strip().removeprefix("W/") == etag for tag in etags.split(",")
+            )
+
+        if b"if-modified-since" in headers:
+            try:
+                since = parsedate_to_datetime(
+                    headers[b"if-modified-since"].decode("latin-1")
+                )
+            except (TypeError, ValueError):
+                return False
+
+            return int(self.stat_result.st_mtime) <= since.timestamp()
+
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["method"] in ("GET", "HEAD") and self.is_not_modified(scope):
+            headers = [
+                (key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in self.headers.items()
+                if key.lower() in NOT_MODIFIED_HEADERS
+            ]
+            await send_http_start(send, 304, headers)
+            return await send_http_body(send)
+
+        return await super().__call__(scope, receive, send)
+
 
 class FastApiBaizeFileResponse(FastApiResponse):
     _baize_response: BaizeFileResponse
@@ -9,7 +67,7 @@ class FastApiBaizeFileResponse(FastApiResponse):
         filepath = str(kwargs.get("filepath", kwargs.get("path", path)))
         kwargs.pop("filepath", None)
         kwargs.pop("path", None)
-        self._baize_response = BaizeFileResponse(filepath, **kwargs)
+        self._baize_response = ConditionalFileResponse(filepath, **kwargs)
         super().__init__(None)
 
     def __call__(self, *args, **kwargs):
@@ -17,3 +75,67 @@ class FastApiBaizeFileResponse(FastApiResponse):
 
     def __getattr__(self, name):
         return getattr(self._baize_response, name)
+
+
+def preferred_format(accept: str, formats: list[str]) -> str | None:
+    """The first of formats the Accept header explicitly allows, if any."""
+    accepted = set()
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality > 0:
+            accepted.add(media_type.lower())
+
+    for image_format in formats:
+        if f"image/{image_format}" in accepted:
+            return image_format
+
+    return None
+
+
+def internal_location(path: str, locations: dict[str, str]) -> str:
+    """The internal nginx location of path, under the deepest folder mapped."""
+    parts = os.path.normpath(path).split(os.sep)
+    for depth in range(len(parts) - 1, 0, -1):
+        folder = os.sep.join(parts[:depth])
+        if folder in locations:
+            return locations[folder] + quote("/".join(parts[depth:]))
+
+    raise ValueError(f"No internal location for {path}")
+
+
+def proxy_file_response(
+    path: str,
+    delivery: str,
+    locations: dict[str, str],
+    headers: dict[str, str] | None = None,
+    content_type: str | None = None,
+) -> FastApiResponse:
+    """An empty response telling the proxy in front of us to send the file.
+
+    locations maps local folders to the internal nginx locations aliased to
+    them. Raises FileNotFoundError like FileResponse when there is nothing to send.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+
+    headers = dict(headers or {})
+    if delivery == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = internal_location(path, locations)
+    elif delivery == "x-sendfile":
+        headers["X-Sendfile"] = os.path.abspath(path)
+    else:
+        raise ValueError(f"Unknown media delivery: {delivery}")
+
+    return FastApiResponse(
+        headers=headers,
+        media_type=content_type or guess_type(path)[0] or "application/octet-stream",
+    )
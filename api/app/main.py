@@ -1,34 +1,57 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
-from functools import lru_cache
 from typing import Annotated
 from uuid import UUID
 
 import jwt
-import requests
-from Crypto.Hash import SHA256
-from fastapi import FastAPI, Depends, UploadFile, status
+from fastapi import (
+    FastAPI,
+    Depends,
+    Header,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from fastapi.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession as Session
 
+from app import cache
+from app.auth import oidc_client
+from app.cache import response_cache
 from app.conf import settings
-from app.db import schemas, crud
+from app.db import schemas, crud, serializers
 from app.db.database import get_db
+from app.db.pagination import InvalidCursor
+from app.media import media_cache
 from app.db.schemas import User, Album
+from app.signing import verify_url
+from app.uploads import (
+    UploadConflict,
+    UploadNotFound,
+    UploadRejected,
+    UploadTooLarge,
+    resumable_uploads,
+)
+from app.worker import processing_queue
 
 
-@lru_cache()
-def get_openid_configuration():
-    return requests.get(settings.openid_configuration, timeout=10).json()
-
-
-@lru_cache()
-def get_jwks_client():
-    return jwt.PyJWKClient(uri=get_openid_configuration()["jwks_uri"])
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await oidc_client.start()
+    await processing_queue.start()
+    await resumable_uploads.start()
+    yield
+    await resumable_uploads.stop()
+    await processing_queue.stop()
+    await oidc_client.stop()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,18 +64,11 @@ app.add_middleware(
 security = HTTPBearer()
 
 
-def get_user_dep(token: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
-    openid_configuration = get_openid_configuration()
-    jwks_client = get_jwks_client()
-
+async def get_user_dep(
+    token: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+):
     try:
-        signing_key = jwks_client.get_signing_key_from_jwt(token.credentials)
-        decoded_jwt = jwt.decode(
-            token.credentials,
-            key=signing_key.key,
-            algorithms=openid_configuration["id_token_signing_alg_values_supported"],
-            options={"verify_aud": False},
-        )
+        decoded_jwt = await oidc_client.verify(token.credentials)
     except jwt.exceptions.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
@@ -71,12 +87,7 @@ def get_user_dep(token: Annotated[HTTPAuthorizationCredentials, Depends(security
 
 
 def verify_signature(path: str, signature: str):
-    if not crud.get_verifier().verify(
-        SHA256.new(path.encode("utf-8")), bytes.fromhex(signature)
-    ):
-        return False
-
-    return True
+    return verify_url(path, signature)
 
 
 @app.post("/albums", response_model=schemas.AlbumList, operation_id="create_album")
@@ -97,7 +108,11 @@ async def create_album(
 async def get_albums(
     db: Session = Depends(get_db), _user: User = Depends(get_user_dep)
 ):
-    return await crud.get_albums(db)
+    async def load():
+        return serializers.dumps(await crud.get_albums(db))
+
+    body = await response_cache.get(cache.ALBUMS, "", load)
+    return Response(body, media_type="application/json")
 
 
 @app.patch(
@@ -113,14 +128,35 @@ async def order_albums(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
         )
 
-    return await crud.order_albums(db, albums)
+    try:
+        return await crud.order_albums(db, albums)
+    except crud.AlbumOrderConflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Albums were changed, reload and try again",
+        )
 
 
 @app.get("/albums/{album_id}", response_model=schemas.Album, operation_id="get_album")
 async def get_album(
-    album_id: UUID, db: Session = Depends(get_db), _user=Depends(get_user_dep)
+    album_id: UUID,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+    _user=Depends(get_user_dep),
 ):
-    return await crud.get_album(db, album_id)
+    async def load():
+        return serializers.dumps(await crud.get_album(db, album_id, limit, cursor))
+
+    try:
+        body = await response_cache.get(
+            cache.album(album_id), f"{limit}|{cursor}", load
+        )
+        return Response(body, media_type="application/json")
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
 
 
 @app.patch(
@@ -173,7 +209,9 @@ async def delete_album(
 
 
 @app.post(
-    "/items/{album_id}", response_model=list[schemas.Item], operation_id="upload_items"
+    "/items/{album_id}",
+    response_model=schemas.UploadResult,
+    operation_id="upload_items",
 )
 async def upload_items(
     album_id: UUID,
@@ -181,35 +219,205 @@ async def upload_items(
     db: Session = Depends(get_db),
     user: User = Depends(get_user_dep),
 ):
-    return await crud.create_items(db, user, items, album_id)
+    db_items, failures = await crud.create_items(db, user, items, album_id)
+    for db_item in db_items:
+        processing_queue.submit(db_item.id)
 
+    return schemas.UploadResult(
+        items=[crud.sign_item(db_item) for db_item in db_items], failed=failures
+    )
 
-@app.get("/items/{item_id}/{expiry}/full", include_in_schema=False)
-async def get_item(
-    item_id: UUID, signature: str, expiry: float, db: Session = Depends(get_db)
+
+def upload_error(error: Exception) -> HTTPException:
+    if isinstance(error, UploadNotFound):
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    if isinstance(error, UploadConflict):
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+    if isinstance(error, UploadTooLarge):
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(error)
+        )
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+
+@app.post(
+    "/uploads",
+    response_model=schemas.Upload,
+    status_code=status.HTTP_201_CREATED,
+    operation_id="create_upload",
+)
+async def create_upload(
+    upload: schemas.UploadCreate,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_user_dep),
 ):
+    """Start a resumable upload, its chunks are sent with append_upload."""
+    try:
+        return await crud.create_upload(db, user, upload)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Album not found"
+        )
+    except UploadRejected as error:
+        raise upload_error(error)
+
+
+@app.get(
+    "/uploads/{upload_id}", response_model=schemas.Upload, operation_id="get_upload"
+)
+async def get_upload(upload_id: UUID, user: User = Depends(get_user_dep)):
+    try:
+        return resumable_uploads.get(upload_id, user.id)
+    except UploadNotFound as error:
+        raise upload_error(error)
+
+
+@app.patch(
+    "/uploads/{upload_id}",
+    response_model=schemas.Upload,
+    operation_id="append_upload",
+)
+async def append_upload(
+    upload_id: UUID,
+    request: Request,
+    upload_offset: Annotated[int, Header()],
+    user: User = Depends(get_user_dep),
+):
+    """Append the request body, Upload-Offset has to be the current offset."""
+    try:
+        return await resumable_uploads.write(
+            upload_id, user.id, upload_offset, request.stream()
+        )
+    except (UploadNotFound, UploadConflict, UploadRejected) as error:
+        raise upload_error(error)
+
+
+@app.post(
+    "/uploads/{upload_id}/finish",
+    response_model=schemas.UploadResult,
+    operation_id="finish_upload",
+)
+async def finish_upload(
+    upload_id: UUID,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_user_dep),
+):
+    try:
+        db_items, failures = await crud.finish_upload(db, user, upload_id)
+    except (UploadNotFound, UploadConflict) as error:
+        raise upload_error(error)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Album not found"
+        )
+    for db_item in db_items:
+        processing_queue.submit(db_item.id)
+
+    return schemas.UploadResult(
+        items=[crud.sign_item(db_item) for db_item in db_items], failed=failures
+    )
+
+
+@app.delete("/uploads/{upload_id}", operation_id="delete_upload")
+async def delete_upload(upload_id: UUID, user: User = Depends(get_user_dep)):
+    try:
+        await resumable_uploads.delete(upload_id, user.id)
+    except (UploadNotFound, UploadConflict) as error:
+        raise upload_error(error)
+
+    return {"success": True}
+
+
+# media is served from the media cache, these endpoints never open a session
+async def media_response(
+    item_id: UUID,
+    expiry: float,
+    kind: str,
+    signature: str,
+    accept: str | None,
+    width: int | None = None,
+    name: str | None = None,
+):
+    path = kind
+    if width is not None:
+        path = f"{kind}/{width}"
+    if name is not None:
+        path = f"{kind}/{name}"
     if not verify_signature(
-        f"{settings.base_url}/items/{item_id}/{expiry}/full", signature
+        f"{settings.base_url}/items/{item_id}/{expiry}/{path}", signature
     ):
         return None
-    if datetime.now().timestamp() > expiry:
+    now = datetime.now().timestamp()
+    if now > expiry:
         return None
 
-    return await crud.get_full(db, item_id)
+    # stored files never change, so they can be cached for as long as the url lives
+    response = await media_cache.response(
+        item_id, kind, accept, width, int(expiry - now), name, expiry
+    )
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    return response
+
+
+@app.get("/items/{item_id}/{expiry}/full", include_in_schema=False)
+async def get_item(
+    item_id: UUID,
+    signature: str,
+    expiry: float,
+    accept: Annotated[str | None, Header()] = None,
+):
+    return await media_response(item_id, expiry, "full", signature, accept)
 
 
 @app.get("/items/{item_id}/{expiry}/cover", include_in_schema=False)
 async def get_cover(
-    item_id: UUID, signature: str, expiry: float, db: Session = Depends(get_db)
+    item_id: UUID,
+    signature: str,
+    expiry: float,
+    accept: Annotated[str | None, Header()] = None,
 ):
-    if not verify_signature(
-        f"{settings.base_url}/items/{item_id}/{expiry}/cover", signature
-    ):
-        return None
-    if datetime.now().timestamp() > expiry:
-        return None
+    return await media_response(item_id, expiry, "cover", signature, accept)
+
 
-    return await crud.get_cover(db, item_id)
+@app.get("/items/{item_id}/{expiry}/w/{width}", include_in_schema=False)
+async def get_derivative(
+    item_id: UUID,
+    signature: str,
+    expiry: float,
+    width: int,
+    accept: Annotated[str | None, Header()] = None,
+):
+    return await media_response(item_id, expiry, "w", signature, accept, width)
+
+
+@app.get("/items/{item_id}/{expiry}/hls/{name}", include_in_schema=False)
+async def get_hls(
+    item_id: UUID,
+    signature: str,
+    expiry: float,
+    name: str,
+):
+    return await media_response(item_id, expiry, "hls", signature, None, name=name)
+
+
+@app.get(
+    "/items/{item_id}/status",
+    response_model=schemas.ItemStatus,
+    operation_id="get_item_status",
+)
+async def get_item_status(
+    item_id: UUID, db: Session = Depends(get_db), _user=Depends(get_user_dep)
+):
+    try:
+        return await crud.get_item_status(db, item_id)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
+        )
 
 
 @app.post(
@@ -226,6 +434,30 @@ async def delete_items(
     return await crud.delete_items(db, user, album_id, items)
 
 
+@app.post(
+    "/items/{album_id}/move",
+    response_model=schemas.Album,
+    operation_id="move_items",
+)
+async def move_items(
+    album_id: UUID,
+    move: schemas.ItemMove,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_user_dep),
+):
+    if not user.admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized"
+        )
+
+    try:
+        return await crud.move_items(db, album_id, move.album_id, move.items)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Album not found"
+        )
+
+
 @app.post(
     "/albums/{album_id}/preview",
     response_model=schemas.Album,
@@ -266,13 +498,34 @@ async def get_user(user: User = Depends(get_user_dep)):
     "/smoelen", response_model=list[schemas.SmoelAlbumList], operation_id="get_smoelen"
 )
 async def get_smoelen(db: Session = Depends(get_db), _user=Depends(get_user_dep)):
-    return await crud.get_smoelen_albums(db)
+    async def load():
+        return serializers.dumps(await crud.get_smoelen_albums(db))
+
+    body = await response_cache.get(cache.SMOELEN, "", load)
+    return Response(body, media_type="application/json")
 
 
 @app.get(
     "/smoelen/{smoel_id}", response_model=schemas.SmoelAlbum, operation_id="get_smoel"
 )
 async def get_smoel(
-    smoel_id: UUID, db: Session = Depends(get_db), _user=Depends(get_user_dep)
+    smoel_id: UUID,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+    _user=Depends(get_user_dep),
 ):
-    return await crud.get_smoel_album(db, smoel_id)
+    async def load():
+        return serializers.dumps(
+            await crud.get_smoel_album(db, smoel_id, limit, cursor)
+        )
+
+    try:
+        body = await response_cache.get(
+            cache.smoel(smoel_id), f"{limit}|{cursor}", load
+        )
+        return Response(body, media_type="application/json")
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from uuid import UUID
+
+from fastapi import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import processing
+from app.conf import settings
+from app.db import models
+from app.db.database import SessionLocal
+from app.fileresponse import preferred_format
+from app.signing import sign_item_url
+from app.storage import storage
+
+
+@dataclass(frozen=True)
+class MediaFiles:
+    path: str
+    cover_path: str
+    widths: list[int]
+    formats: list[str]
+    processed: bool
+    hls: dict[str, int]
+    type: models.Type
+
+    @classmethod
+    def from_item(cls, db_item: models.Item) -> "MediaFiles":
+        return cls(
+            path=db_item.path,
+            cover_path=db_item.cover_path,
+            widths=db_item.widths or [],
+            formats=db_item.formats or [],
+            processed=bool(db_item.processed),
+            hls=db_item.hls or {},
+            type=db_item.type,
+        )
+
+    def file(
+        self, kind: str, width: int | None = None, name: str | None = None
+    ) -> str | None:
+        if kind == "full":
+            return self.path
+        if kind == "cover":
+            # an unprocessed video has no cover yet, the original is no image
+            if not self.processed and self.type == models.Type.VIDEO:
+                return None
+            return self.cover_path
+        if kind == "w" and width in self.widths:
+            return processing.derivative_path(self.path, width)
+        if kind == "hls":
+            path = f"{processing.hls_folder(self.path)}/{name}"
+            if path in processing.hls_files(self.path, self.hls):
+                return path
+
+        return None
+
+
+async def playlist_response(
+    path: str, item_id: UUID, expiry: float, headers: dict[str, str]
+) -> Response:
+    """The HLS playlist at path with every uri replaced by a signed url.
+
+    Players resolve the uris relative to the playlist url and drop its query,
+    so each playlist and segment needs a signature of its own.
+    """
+    lines = (await storage.read(path)).decode("utf8").splitlines()
+
+    playlist = [
+        (
+            line
+            if not line or line.startswith("#")
+            else sign_item_url(item_id, expiry, f"hls/{line}")
+        )
+        for line in lines
+    ]
+    return Response(
+        "\n".join(playlist) + "\n",
+        media_type="application/vnd.apple.mpegurl",
+        headers=headers,
+    )
+
+
+def image_response(
+    path: str,
+    formats: list[str],
+    accept: str | None,
+    headers: dict[str, str] | None = None,
+    max_age: int = 0,
+) -> Response:
+    """Serve the jpeg at path in the best stored format the client accepts."""
+    headers = dict(headers or {})
+    if not formats or not path.endswith(".jpg"):
+        return storage.response(path, headers, max_age=max_age)
+
+    headers["Vary"] = "Accept"
+    image_format = preferred_format(accept or "", formats)
+    if image_format is None:
+        return storage.response(path, headers, max_age=max_age)
+
+    return storage.response(
+        processing.alternate_path(path, image_format),
+        headers,
+        f"image/{image_format}",
+        max_age,
+    )
+
+
+class MediaCache:
+    """Bounded LRU of the stored files per item, so media is served without a query.
+
+    Entries are added whenever an item is signed and dropped when it is deleted.
+    Other workers can not invalidate this process's entries, so a missing file
+    causes a single reload from the database instead of an error.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, maxsize: int):
+        self._session_factory = session_factory
+        self._maxsize = maxsize
+        self._entries: OrderedDict[UUID, MediaFiles] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prime(self, db_item: models.Item):
+        self._store(db_item.id, MediaFiles.from_item(db_item))
+
+    def invalidate(self, item_id: UUID):
+        self._entries.pop(item_id, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, item_id: UUID, files: MediaFiles):
+        self._entries[item_id] = files
+        self._entries.move_to_end(item_id)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, item_id: UUID, refresh: bool = False) -> MediaFiles | None:
+        if not refresh and item_id in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(item_id)
+            return self._entries[item_id]
+
+        self.misses += 1
+        async with self._session_factory() as db:
+            result = await db.execute(
+                select(models.Item).where(models.Item.id == item_id)
+            )
+            db_item = result.scalar_one_or_none()
+
+        if db_item is None:
+            self.invalidate(item_id)
+            return None
+
+        files = MediaFiles.from_item(db_item)
+        self._store(item_id, files)
+        return files
+
+    async def response(
+        self,
+        item_id: UUID,
+        kind: str,
+        accept: str | None,
+        width: int | None = None,
+        max_age: int = 0,
+        name: str | None = None,
+        expiry: float | None = None,
+    ) -> Response | None:
+        """The requested file of an item, cacheable for max_age once processed.
+
+        HLS playlists are signed again with expiry, see playlist_response.
+        """
+        for refresh in (False, True):
+            files = await self.get(item_id, refresh)
+            if files is None:
+                return None
+
+            path = files.file(kind, width, name)
+            if path is None:
+                continue
+
+            # until processed the original stands in for the files that exist
+            if files.processed:
+                cache_control = f"private, max-age={max_age}, immutable"
+            else:
+                cache_control = "private, no-cache"
+
+            headers = {"Cache-Control": cache_control}
+            try:
+                if kind != "hls":
+                    return image_response(path, files.formats, accept, headers, max_age)
+                if path.endswith(".m3u8"):
+                    return await playlist_response(path, item_id, expiry, headers)
+                return storage.response(path, headers, "video/mp2t", max_age)
+            except FileNotFoundError:
+                # processed or deleted by another worker since it was cached
+                continue
+
+        return None
+
+
+media_cache = MediaCache(SessionLocal, settings.media_cache_size)
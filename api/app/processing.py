@@ -0,0 +1,373 @@
+"""Media processing, run in worker processes.
+
+Nothing in here touches the database or the settings so that the functions can
+be pickled to a process pool cheaply.
+"""
+
+import os
+import time
+
+import ffmpeg
+from PIL import ExifTags, Image, ImageOps
+
+HLS_SEGMENT_SECONDS = 6
+HLS_AUDIO_BITRATE = 128_000
+# resize in steps of whole pixel blocks first, nearly as sharp and much faster
+REDUCING_GAP = 3.0
+# orientations that rotate the image by 90 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def check_pixels(img: Image.Image, max_pixels: int):
+    # Pillow only raises on twice its own global limit, ours is per call
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"{img.width}x{img.height} is over {max_pixels} pixels")
+
+
+def probe_image(source: str, max_pixels: int) -> tuple[int, int]:
+    """The size of the image as it is displayed, after its EXIF orientation.
+
+    Only reads the header, the pixel data is not decoded.
+    """
+    with Image.open(source) as img:
+        check_pixels(img, max_pixels)
+        width, height = img.size
+        if img.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+            return height, width
+        return width, height
+
+
+def probe_video(source: str) -> tuple[int, int]:
+    video = video_stream(ffmpeg.probe(source))
+    return video["width"], video["height"]
+
+
+def video_stream(probe: dict) -> dict:
+    return next(s for s in probe["streams"] if s["codec_type"] == "video")
+
+
+def transcode_reason(probe: dict, max_bitrate: int, max_height: int) -> str | None:
+    """Why a video has to be re-encoded, None when copying its streams will do.
+
+    Phones mostly record h264/aac mp4 that browsers play as-is, those are only
+    re-encoded when the bitrate or resolution is above the limits.
+    """
+    format_name = probe["format"]["format_name"]
+    if not {"mov", "mp4"} & set(format_name.split(",")):
+        return f"container {format_name}"
+
+    video = video_stream(probe)
+    if video["codec_name"] != "h264":
+        return f"video codec {video['codec_name']}"
+    if video.get("pix_fmt") != "yuv420p":
+        return f"pixel format {video.get('pix_fmt')}"
+    for stream in probe["streams"]:
+        if stream["codec_type"] == "audio" and stream["codec_name"] != "aac":
+            return f"audio codec {stream['codec_name']}"
+
+    if min(video["width"], video["height"]) > max_height:
+        return f"resolution {video['width']}x{video['height']}"
+    bitrate = int(video.get("bit_rate") or probe["format"].get("bit_rate") or 0)
+    if bitrate > max_bitrate:
+        return f"bitrate {bitrate}"
+
+    return None
+
+
+def save_alternates(img: Image.Image, path: str, formats: list[str]):
+    """Store img in each of formats next to the jpeg at path."""
+    for image_format in formats:
+        img.save(alternate_path(path, image_format))
+
+
+def process_image(
+    source: str,
+    folder: str,
+    widths: list[int],
+    formats: list[str],
+    max_pixels: int = 100_000_000,
+) -> dict:
+    """Create the cover, full size image and a smaller copy for each width.
+
+    The source is decoded once and turned upright according to its EXIF
+    orientation, every copy is scaled down from the previous, larger one.
+    Widths that are not smaller than the image itself are skipped, every jpeg is
+    also stored in each of formats. Returns the values to store on the item.
+    """
+    path = f"{folder}/item.jpg"
+    cover_path = f"{folder}/cover.jpg"
+    created = []
+    with Image.open(source) as img:
+        check_pixels(img, max_pixels)
+        img.load()
+        ImageOps.exif_transpose(img, in_place=True)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        width, height = img.size
+
+        img.save(path)
+        save_alternates(img, path, formats)
+
+        derivative = img
+        for derivative_width in sorted({*widths, 400}, reverse=True):
+            if derivative_width >= width:
+                continue
+
+            derivative = derivative.resize(
+                (derivative_width, max(1, height * derivative_width // width)),
+                Image.Resampling.LANCZOS,
+                reducing_gap=REDUCING_GAP,
+            )
+            if derivative_width == 400:
+                derivative.save(cover_path)
+                save_alternates(derivative, cover_path, formats)
+            if derivative_width in widths:
+                derivative.save(derivative_path(path, derivative_width))
+                save_alternates(
+                    derivative, derivative_path(path, derivative_width), formats
+                )
+                created.append(derivative_width)
+
+        if width <= 400:
+            # small images are their own cover
+            img.save(cover_path)
+            save_alternates(img, cover_path, formats)
+
+    values = {
+        "cover_path": cover_path,
+        "path": path,
+        "width": str(width),
+        "height": str(height),
+        "widths": sorted(created),
+        "formats": formats,
+    }
+    values["size"] = stored_size(values)
+    return values
+
+
+def process_video(
+    source: str,
+    folder: str,
+    widths: list[int],
+    formats: list[str],
+    renditions: list[int] | None = None,
+    max_bitrate: int = 12_000_000,
+    max_height: int = 1080,
+) -> dict:
+    """Create the cover, web playable mp4 and HLS renditions of the given heights.
+
+    The mp4 is a copy of the streams when transcode_reason allows it, otherwise
+    it is re-encoded to at most max_height. widths only apply to images, without
+    renditions no HLS ladder is made. The returned "transcode" entry describes
+    what was done, it is not stored on the item.
+    """
+    probe = ffmpeg.probe(source)
+
+    cover_path = f"{folder}/cover.jpg"
+    stream = ffmpeg.input(source)
+    stream = ffmpeg.filter(stream, "scale", 400, -1)
+    stream = ffmpeg.output(stream, cover_path, vframes=1)
+    # an attempt interrupted by a restart leaves its files behind
+    ffmpeg.run(stream, overwrite_output=True)
+    with Image.open(cover_path) as img:
+        save_alternates(img, cover_path, formats)
+
+    path = f"{folder}/item.mp4"
+    reason = transcode_reason(probe, max_bitrate, max_height)
+    start = time.perf_counter()
+    if reason is None:
+        remux_video(source, path, probe)
+    else:
+        encode_video(source, path, probe, max_height)
+    transcode = {
+        "action": "remux" if reason is None else "encode",
+        "reason": reason,
+        "seconds": time.perf_counter() - start,
+        "duration": float(probe["format"].get("duration") or 0),
+    }
+
+    hls = None
+    if renditions:
+        hls = create_hls(source, hls_folder(path), renditions, probe)
+
+    values = {
+        "cover_path": cover_path,
+        "path": path,
+        "widths": [],
+        "formats": formats,
+        "hls": hls,
+    }
+    values["size"] = stored_size(values)
+    values["transcode"] = transcode
+    return values
+
+
+def has_audio(probe: dict) -> bool:
+    return any(s["codec_type"] == "audio" for s in probe["streams"])
+
+
+def remux_video(source: str, path: str, probe: dict):
+    """Copy the video and audio streams into an mp4 that starts playing early."""
+    stream = ffmpeg.input(source)
+    streams = [stream["v:0"]]
+    if has_audio(probe):
+        streams.append(stream["a:0"])
+    # +faststart moves the index to the front, before the media data
+    ffmpeg.run(
+        ffmpeg.output(*streams, path, c="copy", movflags="+faststart"),
+        overwrite_output=True,
+    )
+
+
+def encode_video(source: str, path: str, probe: dict, max_height: int):
+    stream = ffmpeg.input(source)
+    video = stream["v:0"]
+    width, height = video_stream(probe)["width"], video_stream(probe)["height"]
+    if min(width, height) > max_height:
+        # the short side is limited, so portrait videos keep their resolution too
+        if width >= height:
+            video = video.filter("scale", -2, max_height)
+        else:
+            video = video.filter("scale", max_height, -2)
+
+    streams = [video]
+    if has_audio(probe):
+        streams.append(stream["a:0"])
+    stream = ffmpeg.output(
+        *streams,
+        path,
+        vcodec="libx264",
+        crf=23,
+        pix_fmt="yuv420p",
+        acodec="aac",
+        movflags="+faststart",
+    )
+    ffmpeg.run(stream, overwrite_output=True)
+
+
+def hls_bitrate(width: int, height: int) -> int:
+    # about 0.1 bits per pixel at 30 frames per second
+    return int(width * height * 30 * 0.1)
+
+
+def create_hls(
+    source: str, folder: str, heights: list[int], probe: dict
+) -> dict[str, int]:
+    """Encode an HLS rendition per height below the source's, and a master playlist.
+
+    Segments of every rendition start at the same keyframes so players can switch
+    between them. Returns the number of segments per height.
+    """
+    video = video_stream(probe)
+    audio = has_audio(probe)
+    source_width, source_height = video["width"], video["height"]
+
+    heights = sorted(h for h in set(heights) if h < source_height)
+    if not heights:
+        heights = [source_height - source_height % 2]
+
+    os.makedirs(folder, exist_ok=True)
+    segments = {}
+    master = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for height in heights:
+        # scale=-2 keeps the aspect ratio with an even width
+        width = round(source_width * height / source_height / 2) * 2
+        bitrate = hls_bitrate(width, height)
+
+        stream = ffmpeg.input(source)
+        streams = [stream["v:0"].filter("scale", -2, height)]
+        if audio:
+            streams.append(stream["a:0"])
+        stream = ffmpeg.output(
+            *streams,
+            f"{folder}/{height}p.m3u8",
+            f="hls",
+            vcodec="libx264",
+            preset="veryfast",
+            video_bitrate=bitrate,
+            maxrate=int(bitrate * 1.07),
+            bufsize=int(bitrate * 1.5),
+            force_key_frames=f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+            acodec="aac",
+            audio_bitrate=HLS_AUDIO_BITRATE,
+            hls_time=HLS_SEGMENT_SECONDS,
+            hls_playlist_type="vod",
+            hls_segment_filename=f"{folder}/{height}p_%03d.ts",
+        )
+        ffmpeg.run(stream, overwrite_output=True)
+
+        segments[str(height)] = len(
+            [name for name in os.listdir(folder) if name.startswith(f"{height}p_")]
+        )
+        bandwidth = bitrate + (HLS_AUDIO_BITRATE if audio else 0)
+        master.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}"
+        )
+        master.append(f"{height}p.m3u8")
+
+    with open(f"{folder}/master.m3u8", "w", encoding="utf8") as buffer:
+        buffer.write("\n".join(master) + "\n")
+
+    return segments
+
+
+def derivative_path(path: str, width: int) -> str:
+    return f"{os.path.dirname(path)}/{width}.jpg"
+
+
+def alternate_path(path: str, image_format: str) -> str:
+    return f"{os.path.splitext(path)[0]}.{image_format}"
+
+
+def hls_folder(path: str) -> str:
+    return f"{os.path.dirname(path)}/hls"
+
+
+def hls_files(path: str, hls: dict[str, int] | None) -> set[str]:
+    """Playlists and segments of the HLS renditions of the video at path."""
+    if not hls:
+        return set()
+
+    folder = hls_folder(path)
+    files = {f"{folder}/master.m3u8"}
+    for height, segments in hls.items():
+        files.add(f"{folder}/{height}p.m3u8")
+        files.update(f"{folder}/{height}p_{i:03d}.ts" for i in range(segments))
+
+    return files
+
+
+def stored_files(
+    path: str,
+    cover_path: str,
+    widths: list[int] | None,
+    formats: list[str] | None,
+    hls: dict[str, int] | None = None,
+) -> set[str]:
+    """Every file stored for an item, unprocessed items only have the original."""
+    files = {path, cover_path}
+    files.update(derivative_path(path, width) for width in widths or [])
+    for file in list(files):
+        if file.endswith(".jpg"):
+            files.update(alternate_path(file, fmt) for fmt in formats or [])
+    files.update(hls_files(path, hls))
+
+    return files
+
+
+def stored_size(values: dict) -> int:
+    """Total bytes of the files process_image or process_video stored."""
+    return sum(
+        os.path.getsize(file)
+        for file in stored_files(
+            values["path"],
+            values["cover_path"],
+            values["widths"],
+            values["formats"],
+            values.get("hls"),
+        )
+    )
@@ -0,0 +1,436 @@
+"""Where the files of items are kept.
+
+Files are addressed by key. The files of an item are in a folder named after
+the sha256 of its original, sharded over two levels of hash prefixes, and the
+id of the item that stored it, e.g. "ab/cd/abcd.../{item_id}/item.jpg". Later
+uploads of the same content share those files. Every stored copy has a folder
+of its own, so requests that store the same content at the same time never
+remove each other's files. Albums only exist in the database, so moving an
+item between albums leaves its files alone.
+The keys of items stored before were "data/items/{album_id}/{item_id}/...", the
+local backend still serves those as they are.
+"""
+
+import asyncio
+import datetime
+import errno
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import string
+from typing import Protocol
+from urllib.parse import quote, urlsplit
+
+import httpx
+from fastapi import Response
+from fastapi.responses import RedirectResponse
+
+from app.conf import settings
+from app.fileresponse import FastApiBaizeFileResponse as FileResponse
+from app.fileresponse import internal_location, proxy_file_response
+
+logger = logging.getLogger(__name__)
+
+# presigned urls can not be valid for longer than a week
+MAX_PRESIGN_SECONDS = 7 * 24 * 60 * 60
+# objects are sent and received in pieces of this size
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
+
+def shard(content_hash: str) -> str:
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def is_content_hash(name: str) -> bool:
+    return len(name) == 64 and all(char in string.hexdigits for char in name)
+
+
+class Storage(Protocol):
+    """Stores the files of items, keys are "/" separated paths."""
+
+    def folder(self, content_hash: str) -> str:
+        """The key of the folder holding the stored copies of this content."""
+        ...
+
+    def local_path(self, key: str) -> str | None:
+        """The path of the file on this machine, None when it is stored elsewhere."""
+        ...
+
+    async def save(self, source: str, key: str):
+        """Move the local file at source into the storage."""
+        ...
+
+    async def download(self, key: str, path: str): ...
+
+    async def read(self, key: str) -> bytes: ...
+
+    async def delete(self, keys: set[str]):
+        """Remove the files, and their folders once empty. Failures are logged."""
+        ...
+
+    def response(
+        self,
+        key: str,
+        headers: dict[str, str],
+        content_type: str | None = None,
+        max_age: int = 0,
+    ) -> Response:
+        """Serve the file, raises FileNotFoundError when it is known to be missing."""
+        ...
+
+
+def remove_files(files: set[str], folders: set[str]):
+    """Remove local files, a failure is logged and the rest is still removed."""
+    for path in files:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Removing %s failed", path)
+
+    # nested folders first, a folder that still holds other files is kept
+    for folder in sorted(folders, key=len, reverse=True):
+        try:
+            os.rmdir(folder)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            if error.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                logger.exception("Removing %s failed", folder)
+
+
+def _move(source: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.move(source, path)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as buffer:
+        return buffer.read()
+
+
+class LocalStorage:
+    """Files on this machine, spread over roots by content hash.
+
+    Every root can be a volume of its own. Keys include their root, so roots
+    can be added later without moving files stored before. locations maps
+    folders to the internal nginx locations they are served from.
+    """
+
+    def __init__(self, roots: list[str], locations: dict[str, str] | None = None):
+        self._roots = roots
+        self._locations = {
+            os.path.normpath(folder): location
+            for folder, location in (locations or {}).items()
+        }
+        if settings.media_delivery == "x-accel-redirect":
+            for root in roots:
+                # raises at startup for roots nginx can not send files from
+                internal_location(f"{root}/file", self._locations)
+
+    def folder(self, content_hash: str) -> str:
+        root = self._roots[int(content_hash[:8], 16) % len(self._roots)]
+        return f"{root}/{shard(content_hash)}"
+
+    def local_path(self, key: str) -> str:
+        return key
+
+    async def save(self, source: str, key: str):
+        if source != key:
+            await asyncio.to_thread(_move, source, key)
+
+    async def download(self, key: str, path: str):
+        await asyncio.to_thread(shutil.copyfile, key, path)
+
+    async def read(self, key: str) -> bytes:
+        return await asyncio.to_thread(_read, key)
+
+    async def delete(self, keys: set[str]):
+        folders = {os.path.dirname(key) for key in keys}
+        # the folder of the content too once its last copy is gone, the shard
+        # folders and the album folders of legacy keys are kept
+        folders |= {
+            os.path.dirname(folder)
+            for folder in folders
+            if is_content_hash(os.path.basename(os.path.dirname(folder)))
+        }
+        await asyncio.to_thread(remove_files, keys, folders)
+
+    def response(
+        self,
+        key: str,
+        headers: dict[str, str],
+        content_type: str | None = None,
+        max_age: int = 0,
+    ) -> Response:
+        if settings.media_delivery == "stream":
+            return FileResponse(key, headers=headers, content_type=content_type)
+
+        return proxy_file_response(
+            key,
+            settings.media_delivery,
+            self._locations,
+            headers,
+            content_type,
+        )
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+class SigV4:
+    """AWS signature version 4 for S3 requests, by header or presigned url."""
+
+    algorithm = "AWS4-HMAC-SHA256"
+
+    def __init__(self, access_key: str, secret_key: str, region: str):
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._region = region
+
+    def headers(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        payload_hash: str,
+        now: datetime.datetime,
+    ) -> dict[str, str]:
+        """headers with the ones that authenticate the request added."""
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        headers = {
+            **headers,
+            "host": urlsplit(url).netloc,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+        }
+        canonical = {name.lower(): value.strip() for name, value in headers.items()}
+        signed_headers = ";".join(sorted(canonical))
+        signature = self._signature(
+            method, url, {}, canonical, signed_headers, payload_hash, now
+        )
+        headers["Authorization"] = (
+            f"{self.algorithm} Credential={self._credential(now)}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        del headers["host"]
+        return headers
+
+    def presign(
+        self,
+        method: str,
+        url: str,
+        expires: int,
+        now: datetime.datetime,
+        params: dict[str, str] | None = None,
+    ) -> str:
+        query = {
+            **(params or {}),
+            "X-Amz-Algorithm": self.algorithm,
+            "X-Amz-Credential": self._credential(now),
+            "X-Amz-Date": now.strftime("%Y%m%dT%H%M%SZ"),
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        signature = self._signature(
+            method,
+            url,
+            query,
+            {"host": urlsplit(url).netloc},
+            "host",
+            "UNSIGNED-PAYLOAD",
+            now,
+        )
+        return f"{url}?{canonical_query(query)}&X-Amz-Signature={signature}"
+
+    def _credential(self, now: datetime.datetime) -> str:
+        return f"{self._access_key}/{self._scope(now)}"
+
+    def _scope(self, now: datetime.datetime) -> str:
+        return f"{now.strftime('%Y%m%d')}/{self._region}/s3/aws4_request"
+
+    def _signature(
+        self,
+        method: str,
+        url: str,
+        query: dict[str, str],
+        headers: dict[str, str],
+        signed_headers: str,
+        payload_hash: str,
+        now: datetime.datetime,
+    ) -> str:
+        canonical_headers = "".join(
+            f"{name}:{headers[name]}\n" for name in sorted(headers)
+        )
+        canonical_request = "\n".join(
+            [
+                method,
+                urlsplit(url).path or "/",
+                canonical_query(query),
+                canonical_headers,
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        string_to_sign = "\n".join(
+            [
+                self.algorithm,
+                now.strftime("%Y%m%dT%H%M%SZ"),
+                self._scope(now),
+                hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+            ]
+        )
+
+        key = _hmac(f"AWS4{self._secret_key}".encode("utf-8"), now.strftime("%Y%m%d"))
+        for part in (self._region, "s3", "aws4_request"):
+            key = _hmac(key, part)
+        return hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def canonical_query(query: dict[str, str]) -> str:
+    return "&".join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+
+
+async def _file_chunks(path: str):
+    with open(path, "rb") as buffer:
+        while chunk := await asyncio.to_thread(buffer.read, TRANSFER_CHUNK_SIZE):
+            yield chunk
+
+
+class S3Storage:
+    """Objects in an S3 compatible bucket.
+
+    url is the bucket's base url, path style ("http://minio:9000/media") or
+    virtual hosted ("https://media.s3.eu-west-1.amazonaws.com"). Media is served
+    by a redirect to a presigned url, so the files never pass through this app.
+    Payloads are sent unsigned, use https outside of a trusted network.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        self._url = url.rstrip("/")
+        self._signer = SigV4(access_key, secret_key, region)
+        self._http_client = http_client or httpx.AsyncClient(timeout=60)
+
+    def folder(self, content_hash: str) -> str:
+        return f"items/{shard(content_hash)}"
+
+    def local_path(self, key: str) -> None:
+        return None
+
+    def url(self, key: str) -> str:
+        return f"{self._url}/{quote(key, safe='/-_.~')}"
+
+    async def save(self, source: str, key: str):
+        size = os.path.getsize(source)
+        response = await self._request(
+            "PUT",
+            key,
+            {"content-length": str(size)},
+            content=_file_chunks(source),
+        )
+        response.raise_for_status()
+        await asyncio.to_thread(os.remove, source)
+
+    async def download(self, key: str, path: str):
+        url = self.url(key)
+        headers = self._sign("GET", url, {})
+        async with self._http_client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 404:
+                raise FileNotFoundError(key)
+            response.raise_for_status()
+            with open(path, "wb") as buffer:
+                async for chunk in response.aiter_bytes(TRANSFER_CHUNK_SIZE):
+                    await asyncio.to_thread(buffer.write, chunk)
+
+    async def read(self, key: str) -> bytes:
+        response = await self._request("GET", key, {})
+        if response.status_code == 404:
+            raise FileNotFoundError(key)
+        response.raise_for_status()
+        return response.content
+
+    async def delete(self, keys: set[str]):
+        responses = await asyncio.gather(
+            *(self._request("DELETE", key, {}) for key in keys),
+            return_exceptions=True,
+        )
+        for key, response in zip(keys, responses):
+            if isinstance(response, Exception):
+                logger.error("Removing %s failed: %s", key, response)
+            elif response.is_error and response.status_code != 404:
+                logger.error("Removing %s failed: %s", key, response.status_code)
+
+    def response(
+        self,
+        key: str,
+        headers: dict[str, str],
+        content_type: str | None = None,
+        max_age: int = 0,
+    ) -> Response:
+        # the redirect is cached as long as the url it points to stays valid
+        params = {}
+        if content_type is not None:
+            params["response-content-type"] = content_type
+        if "Cache-Control" in headers:
+            params["response-cache-control"] = headers["Cache-Control"]
+        url = self._signer.presign(
+            "GET",
+            self.url(key),
+            min(max(max_age, 60), MAX_PRESIGN_SECONDS),
+            datetime.datetime.now(datetime.timezone.utc),
+            params,
+        )
+        return RedirectResponse(url, status_code=307, headers=headers)
+
+    def _sign(self, method: str, url: str, headers: dict[str, str]) -> dict[str, str]:
+        return self._signer.headers(
+            method,
+            url,
+            headers,
+            "UNSIGNED-PAYLOAD",
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+
+    async def _request(
+        self, method: str, key: str, headers: dict[str, str], content=None
+    ) -> httpx.Response:
+        url = self.url(key)
+        return await self._http_client.request(
+            method, url, headers=self._sign(method, url, headers), content=content
+        )
+
+
+def from_settings() -> LocalStorage | S3Storage:
+    if settings.storage_backend == "local":
+        locations = {
+            "data": settings.x_accel_redirect_prefix,
+            **settings.x_accel_redirect_locations,
+        }
+        return LocalStorage(settings.storage_roots, locations)
+
+    if settings.storage_backend == "s3":
+        return S3Storage(
+            settings.s3_url,
+            settings.s3_region,
+            settings.s3_access_key,
+            settings.s3_secret_key,
+        )
+
+    raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+
+storage = from_settings()
@@ -0,0 +1,309 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    pass
+
+
+class UploadTooLarge(UploadRejected):
+    def __init__(self, filename: str | None):
+        super().__init__("File is too large")
+        self.filename = filename
+
+
+def _write_chunk(buffer, digest, chunk: bytes):
+    # hashlib releases the GIL for large chunks, so both can run in a thread
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+async def stage_upload(upload: UploadFile, path: str, max_size: int) -> str:
+    """Copy an upload to path one chunk at a time, returns its sha256 hex digest.
+
+    Raises UploadTooLarge, and removes the partial file, once more than
+    max_size bytes have been read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    with open(path, "wb") as buffer:
+        try:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(upload.filename)
+
+                await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+
+    return digest.hexdigest()
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class UploadConflict(Exception):
+    pass
+
+
+@dataclass
+class PartialUpload:
+    id: UUID
+    album_id: UUID | None
+    user: str | None
+    filename: str | None
+    content_type: str
+    size: int
+    offset: int
+    expires: datetime.datetime
+
+
+def _append(buffer, digest, chunk: bytes):
+    buffer.write(chunk)
+    if digest is not None:
+        digest.update(chunk)
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+class ResumableUploads:
+    """Uploads sent in chunks, an interrupted upload continues where it stopped.
+
+    Every upload is a partial file in folder with its metadata in a json file
+    next to it, the offset is the size of the partial file so it survives
+    restarts. Uploads that were not written to for ttl seconds are removed.
+    Only the user that created an upload can see it.
+    """
+
+    def __init__(self, folder: str, ttl: int, max_size: int):
+        self._folder = folder
+        self._ttl = ttl
+        self._max_size = max_size
+        # running sha256 per upload, the file is read again when it is missing
+        self._digests: dict[UUID, object] = {}
+        # uploads being written or taken
+        self._busy: set[UUID] = set()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._clean_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def create(
+        self,
+        album_id: UUID | None,
+        user: str | None,
+        filename: str | None,
+        content_type: str,
+        size: int,
+    ) -> PartialUpload:
+        if size > self._max_size:
+            raise UploadTooLarge(filename)
+
+        upload_id = uuid4()
+        metadata = {
+            "album_id": str(album_id) if album_id is not None else None,
+            "user": user,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+        }
+        os.makedirs(self._folder, exist_ok=True)
+        with open(self._metadata_path(upload_id), "w") as file:
+            json.dump(metadata, file)
+        open(self._partial_path(upload_id), "wb").close()
+        self._digests[upload_id] = hashlib.sha256()
+
+        return self.get(upload_id, user)
+
+    def get(self, upload_id: UUID, user: str | None) -> PartialUpload:
+        try:
+            with open(self._metadata_path(upload_id)) as file:
+                metadata = json.load(file)
+            stat = os.stat(self._partial_path(upload_id))
+        except FileNotFoundError:
+            raise UploadNotFound()
+
+        # someone else's upload is not revealed
+        if metadata["user"] != user or time.time() >= stat.st_mtime + self._ttl:
+            raise UploadNotFound()
+
+        album_id = metadata["album_id"]
+        return PartialUpload(
+            id=upload_id,
+            album_id=UUID(album_id) if album_id is not None else None,
+            user=metadata["user"],
+            filename=metadata["filename"],
+            content_type=metadata["content_type"],
+            size=metadata["size"],
+            offset=stat.st_size,
+            expires=datetime.datetime.fromtimestamp(
+                stat.st_mtime + self._ttl, datetime.timezone.utc
+            ),
+        )
+
+    async def write(
+        self,
+        upload_id: UUID,
+        user: str | None,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+    ) -> PartialUpload:
+        """Append chunks to the upload, they have to continue at its offset.
+
+        What was written before the client went away or an error is raised is
+        kept, a retry continues from the offset get returns.
+        """
+        async with self._exclusive(upload_id):
+            upload = self.get(upload_id, user)
+            if offset != upload.offset:
+                raise UploadConflict(f"Upload is at offset {upload.offset}")
+
+            digest = self._digests.get(upload_id)
+            written = upload.offset
+            with open(self._partial_path(upload_id), "ab") as buffer:
+                try:
+                    pending = bytearray()
+                    async for chunk in chunks:
+                        if written + len(pending) + len(chunk) > upload.size:
+                            raise UploadTooLarge(upload.filename)
+
+                        pending += chunk
+                        if len(pending) >= CHUNK_SIZE:
+                            await run_in_threadpool(
+                                _append, buffer, digest, bytes(pending)
+                            )
+                            written += len(pending)
+                            pending.clear()
+
+                    if pending:
+                        await run_in_threadpool(_append, buffer, digest, bytes(pending))
+                        written += len(pending)
+                except BaseException:
+                    # a chunk that failed halfway is not part of the digest
+                    buffer.truncate(written)
+                    raise
+
+        return self.get(upload_id, user)
+
+    async def take(self, upload_id: UUID, user: str | None, path: str) -> str:
+        """Move a complete upload to path, returns its sha256 hex digest."""
+        async with self._exclusive(upload_id):
+            upload = self.get(upload_id, user)
+            if upload.offset != upload.size:
+                raise UploadConflict(f"Upload is at offset {upload.offset}")
+
+            digest = self._digests.pop(upload_id, None)
+            await run_in_threadpool(shutil.move, self._partial_path(upload_id), path)
+            os.remove(self._metadata_path(upload_id))
+
+        if digest is None:
+            return await run_in_threadpool(_file_digest, path)
+        return digest.hexdigest()
+
+    async def delete(self, upload_id: UUID, user: str | None):
+        async with self._exclusive(upload_id):
+            self.get(upload_id, user)
+            self._remove(upload_id)
+
+    def temporary_path(self) -> str:
+        """A path in the upload folder, clean removes it when it is left behind."""
+        os.makedirs(self._folder, exist_ok=True)
+        return self._partial_path(uuid4())
+
+    def is_temporary(self, path: str) -> bool:
+        return os.path.dirname(path) == self._folder
+
+    def clean(self):
+        """Remove uploads that were not written to for ttl seconds."""
+        if not os.path.isdir(self._folder):
+            return
+
+        now = time.time()
+        for name in os.listdir(self._folder):
+            try:
+                upload_id = UUID(name.removesuffix(".json"))
+            except ValueError:
+                continue
+            if upload_id in self._busy:
+                continue
+
+            # the metadata is only written once, the partial file on every chunk
+            partial = self._partial_path(upload_id)
+            path = partial if os.path.exists(partial) else f"{self._folder}/{name}"
+            try:
+                modified = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if modified + self._ttl <= now:
+                self._remove(upload_id)
+
+    def _partial_path(self, upload_id: UUID) -> str:
+        return f"{self._folder}/{upload_id}"
+
+    def _metadata_path(self, upload_id: UUID) -> str:
+        return f"{self._folder}/{upload_id}.json"
+
+    def _remove(self, upload_id: UUID):
+        self._digests.pop(upload_id, None)
+        for path in (self._partial_path(upload_id), self._metadata_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @asynccontextmanager
+    async def _exclusive(self, upload_id: UUID):
+        # chunks of one upload are sent one after the other, never in parallel
+        if upload_id in self._busy:
+            raise UploadConflict("Upload is being written")
+
+        self._busy.add(upload_id)
+        try:
+            yield
+        finally:
+            self._busy.discard(upload_id)
+
+    async def _clean_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.clean)
+            except OSError:
+                logger.exception("Removing expired uploads failed")
+            await asyncio.sleep(min(self._ttl, 60 * 60))
+
+
+resumable_uploads = ResumableUploads(
+    "data/uploads", settings.upload_ttl, settings.max_upload_size
+)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import processing
+from app.cache import response_cache
+from app.conf import settings
+from app.db import models
+from app.db.crud import cached_namespaces
+from app.db.database import SessionLocal
+from app.db.summaries import add_album_bytes
+from app.media import media_cache
+from app.storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingQueue:
+    """Generates covers and optimized files for uploaded items.
+
+    Uploads are stored as-is with processed=false, the heavy work runs in a
+    process pool so it never blocks the event loop. Unprocessed items are picked
+    up again on start, so the items table doubles as a persistent queue.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, workers: int):
+        self._session_factory = session_factory
+        self._workers = workers
+        self._queue: asyncio.Queue[UUID] = asyncio.Queue()
+        self._executor: ProcessPoolExecutor | None = None
+        self._tasks: list[asyncio.Task] = []
+        # linked duplicate uploads share one original, process it only once
+        self._in_progress: set[str] = set()
+        # seconds of video re-encoded per second, to estimate what remuxing saves
+        self._encode_speed: float | None = None
+
+    async def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._workers)]
+
+        async with self._session_factory() as db:
+            result = await db.execute(
+                select(models.Item.id).where(models.Item.processed.is_(False))
+            )
+            for item_id in result.scalars():
+                self.submit(item_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, item_id: UUID):
+        self._queue.put_nowait(item_id)
+
+    async def join(self):
+        await self._queue.join()
+
+    async def _run(self):
+        while True:
+            item_id = await self._queue.get()
+            try:
+                await self.process(item_id)
+            except Exception:
+                logger.exception("Processing item %s failed", item_id)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, item_id: UUID):
+        async with self._session_factory() as db:
+            db_item = await db.get(models.Item, item_id)
+            if db_item is None or db_item.processed:
+                return
+
+            source = db_item.path
+            file_type = db_item.type
+
+        if source in self._in_progress:
+            return
+
+        self._in_progress.add(source)
+        try:
+            await self._process(item_id, source, file_type)
+        finally:
+            self._in_progress.discard(source)
+            media_cache.invalidate(item_id)
+
+    async def _process(self, item_id: UUID, source: str, file_type: models.Type):
+        local_source = storage.local_path(source)
+        if local_source is not None:
+            # the files are created next to the original
+            values = await self._convert(
+                item_id, local_source, os.path.dirname(local_source), file_type
+            )
+        else:
+            values = await self._convert_remote(item_id, source, file_type)
+        stored = processing.stored_files(
+            values["path"],
+            values["cover_path"],
+            values["widths"],
+            values["formats"],
+            values.get("hls"),
+        )
+
+        async with self._session_factory() as db:
+            result = await db.execute(
+                select(models.Item.id, models.Item.album_id, models.Item.size).where(
+                    models.Item.path == source
+                )
+            )
+            previous = result.all()
+            namespaces = await cached_namespaces(
+                db, [item_id for item_id, _, _ in previous]
+            )
+            # updates every item sharing this original
+            result = await db.execute(
+                update(models.Item)
+                .where(models.Item.path == source)
+                .values(**values, processed=True)
+            )
+            for _, album_id, size in previous:
+                await add_album_bytes(db, album_id, values["size"] - (size or 0))
+            await db.commit()
+        await response_cache.invalidate(*namespaces)
+        # S3 redirects can not tell a missing file, so the media cache is not
+        # reloaded on its own; every item sharing the original now has new files
+        for shared_id, _, _ in previous:
+            media_cache.invalidate(shared_id)
+
+        if result.rowcount == 0:
+            # deleted while it was being processed
+            await storage.delete(stored | {source})
+            return
+
+        # an item stored before the worker has its original at the path of the
+        # full size file, which was just written over it
+        await storage.delete({source} - stored)
+
+    async def _convert(
+        self, item_id: UUID, source: str, folder: str, file_type: models.Type
+    ) -> dict:
+        args = [source, folder, settings.derivative_widths, settings.image_formats]
+        if file_type == models.Type.IMAGE:
+            process = processing.process_image
+            args.append(settings.max_image_pixels)
+        else:
+            process = processing.process_video
+            args += [
+                settings.hls_renditions,
+                settings.video_max_bitrate,
+                settings.video_max_height,
+            ]
+
+        loop = asyncio.get_running_loop()
+        values = await loop.run_in_executor(self._executor, process, *args)
+        transcode = values.pop("transcode", None)
+        if transcode is not None:
+            self._log_transcode(item_id, transcode)
+
+        return values
+
+    async def _convert_remote(
+        self, item_id: UUID, source: str, file_type: models.Type
+    ) -> dict:
+        """Process a copy of the original in a scratch folder, then store the files."""
+        folder = os.path.dirname(source)
+        scratch = await asyncio.to_thread(tempfile.mkdtemp)
+        try:
+            original = f"{scratch}/original"
+            await storage.download(source, original)
+            values = await self._convert(item_id, original, scratch, file_type)
+
+            files = processing.stored_files(
+                values["path"],
+                values["cover_path"],
+                values["widths"],
+                values["formats"],
+                values.get("hls"),
+            )
+            # keys mirror the layout of the scratch folder
+            await asyncio.gather(
+                *(
+                    storage.save(file, folder + file.removeprefix(scratch))
+                    for file in files
+                )
+            )
+        finally:
+            await asyncio.to_thread(shutil.rmtree, scratch, ignore_errors=True)
+
+        for column in ("path", "cover_path"):
+            values[column] = folder + values[column].removeprefix(scratch)
+        return values
+
+    def _log_transcode(self, item_id: UUID, transcode: dict):
+        duration, seconds = transcode["duration"], transcode["seconds"]
+        if transcode["action"] == "encode":
+            if duration and seconds:
+                speed = duration / seconds
+                self._encode_speed = (
+                    speed
+                    if self._encode_speed is None
+                    else 0.8 * self._encode_speed + 0.2 * speed
+                )
+            logger.info(
+                "Item %s: re-encoded %.1fs of video in %.1fs (%s)",
+                item_id,
+                duration,
+                seconds,
+                transcode["reason"],
+            )
+        elif self._encode_speed is None:
+            logger.info(
+                "Item %s: remuxed %.1fs of video in %.1fs",
+                item_id,
+                duration,
+                seconds,
+            )
+        else:
+            logger.info(
+                "Item %s: remuxed %.1fs of video in %.1fs, about %.1fs saved",
+                item_id,
+                duration,
+                seconds,
+                max(duration / self._encode_speed - seconds, 0),
+            )
+
+
+processing_queue = ProcessingQueue(SessionLocal, settings.processing_workers)
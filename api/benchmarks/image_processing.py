@@ -0,0 +1,101 @@
+"""Compare processing 24MP camera JPEGs before and after the single decode.
+
+The old pipeline opened the source twice, once for the cover and again for the
+full size copy and the derivatives. The new one decodes it once, turns it
+upright and scales every copy down from the previous one. The old pipeline
+ignored the EXIF orientation, so rotated sources are measured separately.
+Alternate formats are left out, encoding a 24MP webp takes seconds and is the
+same in both. Each run is a fresh process so the peak RSS of one does not hide
+the other.
+
+Run from the api directory: ``PYTHONPATH=. python benchmarks/image_processing.py``
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import ExifTags, Image
+
+from app import processing
+
+SIZE = (6000, 4000)
+IMAGES = 5
+WIDTHS = [200, 400, 800, 1600]
+FORMATS: list[str] = []
+
+
+def make_source(path: str, orientation: int):
+    # noise compresses and decodes like a photo, a flat color would not
+    img = Image.effect_noise(SIZE, 64).convert("RGB")
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    img.save(path, format="JPEG", quality=90, exif=exif)
+
+
+def legacy(source: str, folder: str, widths: list[int], formats: list[str]):
+    cover_path = f"{folder}/cover.jpg"
+    with Image.open(source) as img:
+        width, height = img.size
+        img.thumbnail((400, 400 * height // width))
+        img.save(cover_path)
+        processing.save_alternates(img, cover_path, formats)
+
+    path = f"{folder}/item.jpg"
+    with Image.open(source) as img:
+        img.save(path)
+        processing.save_alternates(img, path, formats)
+
+        derivative = img
+        for derivative_width in sorted(widths, reverse=True):
+            if derivative_width >= width:
+                continue
+
+            derivative = derivative.resize(
+                (derivative_width, max(1, height * derivative_width // width)),
+                Image.Resampling.LANCZOS,
+            )
+            derivative.save(processing.derivative_path(path, derivative_width))
+            processing.save_alternates(
+                derivative, processing.derivative_path(path, derivative_width), formats
+            )
+
+
+def run(name: str, source: str) -> tuple[float, int]:
+    process = legacy if name == "legacy" else processing.process_image
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        for _ in range(IMAGES):
+            process(source, folder, WIDTHS, FORMATS)
+        elapsed = time.perf_counter() - start
+
+    # in KiB on Linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench(name: str, source: str, label: str):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        elapsed, max_rss = executor.submit(run, name, source).result()
+
+    print(
+        f"{label:>7} {name:>6}: {IMAGES / elapsed:5.2f} images/s, "
+        f"peak RSS {max_rss / 1024:6.1f} MiB"
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        for label, orientation in (("upright", 1), ("rotated", 6)):
+            source = os.path.join(folder, f"{label}.jpg")
+            make_source(source, orientation)
+
+            bench("legacy", source, label)
+            bench("single", source, label)
+
+
+if __name__ == "__main__":
+    main()
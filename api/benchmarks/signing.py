@@ -0,0 +1,52 @@
+"""Compare URL signing throughput of the RSA and HMAC backends.
+
+Run from the api directory: ``PYTHONPATH=. python benchmarks/signing.py``
+"""
+
+import time
+from uuid import uuid4
+
+from Crypto.PublicKey import RSA
+
+from app.signing import HMACBackend, RSABackend
+
+ALBUM_SIZE = 3000
+BASE_URL = "https://media.djoamersfoort.nl/api"
+
+
+def album_urls(size: int) -> list[bytes]:
+    urls = []
+    for _ in range(size):
+        item_id = uuid4()
+        for kind in ("cover", "full"):
+            urls.append(f"{BASE_URL}/items/{item_id}/1700000000.0/{kind}".encode())
+
+    return urls
+
+
+def bench(name: str, backend, urls: list[bytes]):
+    start = time.perf_counter()
+    for url in urls:
+        backend.sign(url)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:>5}: {len(urls)} urls in {elapsed * 1000:9.1f} ms "
+        f"({len(urls) / elapsed:12.0f} urls/s)"
+    )
+
+
+def main():
+    urls = album_urls(ALBUM_SIZE)
+    key = RSA.generate(2048)
+
+    bench(
+        "rsa",
+        RSABackend(key.export_key().decode(), key.publickey().export_key().decode()),
+        urls,
+    )
+    bench("hmac", HMACBackend(b"benchmark key"), urls)
+
+
+if __name__ == "__main__":
+    main()
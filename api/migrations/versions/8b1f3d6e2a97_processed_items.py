@@ -0,0 +1,27 @@
+"""processed items
+
+Revision ID: 8b1f3d6e2a97
+Revises: 6d3a1e8f9c24
+Create Date: 2026-10-18 21:04:37.218463
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b1f3d6e2a97"
+down_revision: Union[str, None] = "6d3a1e8f9c24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # items stored before the worker already have their cover and web files,
+    # the worker would otherwise process them again on start
+    op.execute("UPDATE items SET processed = 1")
+
+
+def downgrade() -> None:
+    pass
@@ -0,0 +1,28 @@
+"""item dates
+
+Revision ID: c4e7a2f9d315
+Revises: 8b1f3d6e2a97
+Create Date: 2026-10-18 21:32:09.481126
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e7a2f9d315"
+down_revision: Union[str, None] = "8b1f3d6e2a97"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # dates set by SQLite lack the microseconds of the ones set by the app, the
+    # item pages compare them as text
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("UPDATE items SET date = date || '.000000' WHERE length(date) = 19")
+
+
+def downgrade() -> None:
+    pass
@@ -4,11 +4,13 @@ from unittest.mock import MagicMock
 
 import pytest
 import pytest_asyncio
-from httpx import AsyncClient, ASGITransport
+from cryptography.hazmat.primitives.asymmetric import rsa
+from httpx import AsyncClient, ASGITransport, MockTransport, Request, Response
+from jwt.algorithms import RSAAlgorithm
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.pool import StaticPool
 
-from app.db import crud
+from app import auth, signing
 from app.db.database import Base, get_db
 from app.main import app
 
@@ -23,31 +25,71 @@ engine = create_async_engine(
 TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(scope="session")
+def oidc_private_key() -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def oidc_jwks(oidc_private_key) -> dict:
+    jwk = RSAAlgorithm.to_jwk(oidc_private_key.public_key(), as_dict=True)
+    return {"keys": [{**jwk, "kid": "test", "use": "sig", "alg": "RS256"}]}
+
+
 @pytest.fixture(autouse=True)
-def mock_oidc():
+def mock_oidc(monkeypatch, oidc_jwks):
     from app import main
 
-    main.get_openid_configuration = MagicMock(
-        return_value={
-            "jwks_uri": "http://test/jwks",
-            "id_token_signing_alg_values_supported": ["RS256"],
-        }
+    # Serve the configuration and oidc_jwks instead of fetching them
+    def handler(request: Request) -> Response:
+        if request.url.path == "/jwks":
+            return Response(200, json=oidc_jwks)
+        return Response(
+            200,
+            json={
+                "jwks_uri": "http://test/jwks",
+                "id_token_signing_alg_values_supported": ["RS256"],
+            },
+        )
+
+    oidc_client = auth.OIDCClient(
+        "http://test/.well-known/openid-configuration",
+        60,
+        auth.ClaimsCache(16, 60),
+        AsyncClient(transport=MockTransport(handler)),
     )
-    main.get_jwks_client = MagicMock()
-    yield
+    monkeypatch.setattr(main, "oidc_client", oidc_client)
+    yield oidc_client
+
+
+@pytest.fixture(autouse=True)
+def mock_signing(monkeypatch):
+    # Sign with a fixed HMAC key instead of reading one from data/
+    backend = signing.HMACBackend(b"test_signing_key")
+    monkeypatch.setattr(signing, "get_backend", MagicMock(return_value=backend))
+    signing.sign_item_url.cache_clear()
+    yield backend
 
 
 @pytest.fixture(autouse=True)
-def mock_signing():
-    mock_signer = MagicMock()
-    mock_signer.sign.return_value = b"mock_signature"
-    mock_verifier = MagicMock()
-    mock_verifier.verify.return_value = True
+def mock_media_cache(monkeypatch):
+    from app.media import media_cache
 
-    # Patch lru_cache decorated functions
-    crud.get_signer = MagicMock(return_value=mock_signer)
-    crud.get_verifier = MagicMock(return_value=mock_verifier)
-    yield
+    # Look up media in the test database
+    monkeypatch.setattr(media_cache, "_session_factory", TestingSessionLocal)
+    media_cache.clear()
+    yield media_cache
+
+
+@pytest.fixture(autouse=True)
+def mock_response_cache(monkeypatch):
+    from app.cache import MemoryBackend, response_cache
+
+    # Start every test with an empty cache
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend(1024 * 1024))
+    response_cache.hits.clear()
+    response_cache.misses.clear()
+    yield response_cache
 
 
 @pytest_asyncio.fixture(scope="session")
@@ -67,6 +109,12 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest.fixture
+def session_factory(db_session: AsyncSession) -> async_sessionmaker:
+    # for code that opens its own sessions instead of using get_db
+    return TestingSessionLocal
+
+
 @pytest_asyncio.fixture(scope="function")
 async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     async def override_get_db():
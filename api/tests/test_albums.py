@@ -1,5 +1,5 @@
 from unittest.mock import patch
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import pytest
 
@@ -144,3 +144,227 @@ async def test_delete_album(admin_client, db_session):
 
     assert response.status_code == 200
     assert response.json() == {"success": True}
+
+
+@pytest.mark.asyncio
+async def test_get_album_paginated(admin_client, db_session):
+    import datetime
+
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(
+        models.Album(id=album_id, name="Paged Album", description="Desc", order=0)
+    )
+    base = datetime.datetime(2024, 1, 1)
+    item_ids = []
+    for i in range(5):
+        item_id = uuid4()
+        item_ids.append(item_id)
+        db_session.add(
+            models.Item(
+                id=item_id,
+                album_id=album_id,
+                path="tests/item.jpg",
+                cover_path="tests/cover.jpg",
+                type=models.Type.IMAGE,
+                width="100",
+                height="100",
+                # two items share a date to exercise the id tie-breaker
+                date=base + datetime.timedelta(days=min(i, 3)),
+            )
+        )
+    await db_session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await admin_client.get(f"/albums/{album_id}", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) <= 2
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert set(seen) == {str(item_id) for item_id in item_ids}
+    assert seen[-1] == str(item_ids[0])
+
+    response = await admin_client.get(f"/albums/{album_id}")
+    assert response.json()["next"] is None
+    assert len(response.json()["items"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_get_album_cursor_item_deleted(admin_client, db_session):
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    # dated by the database, within the same second
+    db_session.add_all(
+        models.Item(
+            id=uuid4(),
+            album_id=album_id,
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+        )
+        for _ in range(5)
+    )
+    await db_session.commit()
+
+    response = await admin_client.get(f"/albums/{album_id}", params={"limit": 2})
+    first, last = response.json()["items"]
+    await db_session.delete(await db_session.get(models.Item, UUID(last["id"])))
+    await db_session.commit()
+
+    response = await admin_client.get(
+        f"/albums/{album_id}", params={"limit": 2, "cursor": response.json()["next"]}
+    )
+    data = response.json()
+    assert len(data["items"]) == 2
+    assert first["id"] not in [item["id"] for item in data["items"]]
+
+
+@pytest.mark.asyncio
+async def test_get_album_invalid_cursor(admin_client, db_session):
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+
+    response = await admin_client.get(
+        f"/albums/{album_id}", params={"cursor": "garbage"}
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.asyncio
+async def test_get_smoel_paginated(admin_client, db_session):
+    from app.db import models
+
+    smoel_id = uuid4()
+    smoel = models.Smoel(id=smoel_id, name="Smoel")
+    items = [
+        models.Item(
+            id=uuid4(),
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+        )
+        for _ in range(3)
+    ]
+    smoel.items = items
+    db_session.add(smoel)
+    await db_session.commit()
+
+    response = await admin_client.get(f"/smoelen/{smoel_id}", params={"limit": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["items"]) == 2
+    assert data["items"][0]["smoelen"][0]["id"] == str(smoel_id)
+
+    response = await admin_client.get(
+        f"/smoelen/{smoel_id}", params={"limit": 2, "cursor": data["next"]}
+    )
+    data = response.json()
+    assert len(data["items"]) == 1
+    assert data["next"] is None
+
+    response = await admin_client.get(f"/smoelen/{smoel_id}")
+    assert len(response.json()["items"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_smoelen(admin_client, db_session):
+    import datetime
+
+    from app.db import models
+
+    base = datetime.datetime(2024, 1, 1)
+    items = [
+        models.Item(
+            id=uuid4(),
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+            date=base + datetime.timedelta(days=i),
+        )
+        for i in range(3)
+    ]
+    few = models.Smoel(id=uuid4(), name="Few", preview=items[0], items=items[:1])
+    many = models.Smoel(id=uuid4(), name="Many", preview=items[0], items=items)
+    db_session.add_all([few, many])
+    ids = [str(item.id) for item in items]
+    few_id, many_id = str(few.id), str(many.id)
+    await db_session.commit()
+
+    response = await admin_client.get("/smoelen")
+
+    assert response.status_code == 200
+    data = response.json()
+    # most tagged first, each with its two most recent items
+    assert [smoel["id"] for smoel in data] == [many_id, few_id]
+    assert [item["id"] for item in data[0]["items"]] == [ids[2], ids[1]]
+    assert [item["id"] for item in data[1]["items"]] == [ids[0]]
+    assert data[0]["preview"]["id"] == ids[0]
+
+
+@pytest.mark.asyncio
+async def test_order_albums(admin_client, db_session):
+    from app.db import models
+
+    album_ids = [uuid4() for _ in range(3)]
+    for order, album_id in enumerate(album_ids):
+        db_session.add(
+            models.Album(
+                id=album_id, name=f"Album {order}", description="", order=order
+            )
+        )
+    await db_session.commit()
+
+    response = await admin_client.get("/albums")
+    versions = {album["id"]: album["version"] for album in response.json()}
+    new_order = [
+        {"id": str(album_id), "order": order, "version": versions[str(album_id)]}
+        for order, album_id in enumerate(reversed(album_ids))
+    ]
+
+    response = await admin_client.patch("/albums", json=new_order)
+    assert response.status_code == 200
+    orders = {album["id"]: album["order"] for album in response.json()}
+    assert orders == {str(album_id): 2 - i for i, album_id in enumerate(album_ids)}
+    assert all(album["version"] == 1 for album in response.json())
+
+    # a second reorder based on the same versions conflicts and changes nothing
+    response = await admin_client.patch("/albums", json=new_order[::-1])
+    assert response.status_code == 409
+
+    response = await admin_client.get("/albums")
+    assert {album["id"]: album["order"] for album in response.json()} == orders
+
+    # the version is required, an order without it could overwrite a newer one
+    response = await admin_client.patch(
+        "/albums", json=[{"id": str(album_ids[0]), "order": 0}]
+    )
+    assert response.status_code == 422
+
+    response = await admin_client.patch(
+        "/albums", json=[{"id": str(uuid4()), "order": 0, "version": 0}]
+    )
+    assert response.status_code == 409
@@ -0,0 +1,134 @@
+import time
+from unittest.mock import MagicMock
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from httpx import AsyncClient, MockTransport, Response
+from jwt.algorithms import RSAAlgorithm
+
+from app.auth import ClaimsCache, OIDCClient
+
+
+def make_token(private_key, kid: str = "test", **claims) -> str:
+    payload = {
+        "sub": "119",
+        "media": True,
+        "account_type": "begeleider",
+        "exp": int(time.time()) + 60,
+        **claims,
+    }
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.mark.asyncio
+async def test_users_me_with_token(client: AsyncClient, oidc_private_key):
+    token = make_token(oidc_private_key)
+    response = await client.get(
+        "/users/me", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"id": "119", "admin": True}
+
+
+@pytest.mark.asyncio
+async def test_verified_tokens_are_cached(
+    client: AsyncClient, oidc_private_key, monkeypatch
+):
+    decode = MagicMock(wraps=jwt.decode)
+    monkeypatch.setattr(jwt, "decode", decode)
+    headers = {"Authorization": f"Bearer {make_token(oidc_private_key)}"}
+
+    for _ in range(3):
+        response = await client.get("/users/me", headers=headers)
+        assert response.status_code == 200
+
+    assert decode.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_tokens(client: AsyncClient, oidc_private_key):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    tokens = [
+        make_token(other_key),
+        make_token(oidc_private_key, exp=int(time.time()) - 10),
+        make_token(oidc_private_key, kid="unknown"),
+        "not a token",
+    ]
+
+    for token in tokens:
+        response = await client.get(
+            "/users/me", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Invalid token"
+
+    response = await client.get(
+        "/users/me",
+        headers={
+            "Authorization": f"Bearer {make_token(oidc_private_key, media=False)}"
+        },
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Not authorized"
+
+
+@pytest.mark.asyncio
+async def test_rotated_keys_are_fetched(
+    client: AsyncClient, mock_oidc, oidc_private_key, oidc_jwks
+):
+    token = make_token(oidc_private_key)
+    response = await client.get(
+        "/users/me", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+
+    new_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(new_key.public_key(), as_dict=True)
+    oidc_jwks["keys"] = [{**jwk, "kid": "new", "use": "sig", "alg": "RS256"}]
+
+    # unknown key ids only refresh the keys once min_refresh_interval passed
+    headers = {"Authorization": f"Bearer {make_token(new_key, kid='new')}"}
+    response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 401
+
+    mock_oidc.min_refresh_interval = 0
+    response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "configuration",
+    [Response(200, text="<html>"), Response(200, json={}), Response(503)],
+)
+async def test_start_with_broken_provider(configuration, caplog):
+    http_client = AsyncClient(transport=MockTransport(lambda request: configuration))
+    oidc = OIDCClient("https://provider.test", 60, ClaimsCache(1, 1), http_client)
+
+    # the app starts anyway, tokens are refused until a refresh succeeds
+    await oidc.start()
+    await oidc.stop()
+    assert caplog.messages == ["Fetching the OpenID configuration failed"]
+
+
+def test_claims_cache_expiry(monkeypatch):
+    cache = ClaimsCache(maxsize=2, ttl=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    cache.set("a", {"sub": "a", "exp": now + 10})
+    cache.set("b", {"sub": "b"})
+    assert cache.get("a") == {"sub": "a", "exp": now + 10}
+
+    # least recently used entries are evicted first
+    cache.set("c", {"sub": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    # entries expire with the token, or after ttl
+    monkeypatch.setattr(time, "time", lambda: now + 10)
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert cache.get("c") is None
@@ -0,0 +1,117 @@
+import time
+from uuid import uuid4
+
+import pytest
+
+from app.cache import MemoryBackend, ResponseCache
+
+
+@pytest.mark.asyncio
+async def test_album_responses_cached(admin_client, db_session, mock_response_cache):
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+
+    for _ in range(2):
+        response = await admin_client.get("/albums")
+        assert response.json()[0]["name"] == "Album"
+        response = await admin_client.get(f"/albums/{album_id}")
+        assert response.json()["name"] == "Album"
+
+    assert mock_response_cache.misses == {"albums": 1, "album": 1}
+    assert mock_response_cache.hits == {"albums": 1, "album": 1}
+
+    # a change is visible immediately
+    response = await admin_client.patch(
+        f"/albums/{album_id}", json={"name": "Renamed", "description": ""}
+    )
+    assert response.status_code == 200
+    response = await admin_client.get("/albums")
+    assert response.json()[0]["name"] == "Renamed"
+    response = await admin_client.get(f"/albums/{album_id}")
+    assert response.json()["name"] == "Renamed"
+    assert mock_response_cache.misses == {"albums": 2, "album": 2}
+
+
+@pytest.mark.asyncio
+async def test_deleting_items_invalidates_smoelen(
+    admin_client, db_session, mock_response_cache
+):
+    from unittest.mock import patch
+
+    from app.db import models
+
+    album_id, smoel_id, other_id = uuid4(), uuid4(), uuid4()
+    items = [
+        models.Item(
+            id=uuid4(),
+            album_id=album_id,
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+        )
+        for _ in range(2)
+    ]
+    item_id = str(items[0].id)
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    db_session.add(
+        models.Smoel(id=smoel_id, name="Smoel", items=items, preview=items[1])
+    )
+    db_session.add(
+        models.Smoel(id=other_id, name="Other", items=items[1:], preview=items[1])
+    )
+    await db_session.commit()
+
+    response = await admin_client.get(f"/smoelen/{smoel_id}")
+    assert len(response.json()["items"]) == 2
+    await admin_client.get(f"/smoelen/{other_id}")
+    await admin_client.get("/smoelen")
+
+    with patch("os.remove"), patch("os.rmdir"):
+        response = await admin_client.post(f"/items/{album_id}/delete", json=[item_id])
+    assert response.status_code == 200
+
+    response = await admin_client.get(f"/smoelen/{smoel_id}")
+    assert len(response.json()["items"]) == 1
+    response = await admin_client.get("/smoelen")
+    assert len(response.json()[0]["items"]) == 1
+    # a smoel the item was not tagged in is still served from the cache
+    await admin_client.get(f"/smoelen/{other_id}")
+    assert mock_response_cache.hits == {"smoel": 1}
+
+
+@pytest.mark.asyncio
+async def test_memory_backend(monkeypatch):
+    cache = ResponseCache(MemoryBackend(max_bytes=10), ttl=60)
+
+    async def load():
+        return b"12345"
+
+    assert await cache.get("a", "1", load) == b"12345"
+    assert await cache.get("a", "1", load) == b"12345"
+    assert cache.hits == {"a": 1}
+
+    # the least recently used body is evicted once the size is exceeded
+    await cache.get("a", "2", load)
+    await cache.get("b", "1", load)
+    await cache.get("a", "1", load)
+    assert cache.misses == {"a": 3, "b": 1}
+
+    # a body loaded while its namespace was invalidated is not stored
+    async def load_invalidated():
+        await cache.invalidate("c")
+        return b"old"
+
+    await cache.get("c", "1", load_invalidated)
+    await cache.get("c", "1", load)
+    assert cache.misses["c"] == 2
+
+    # bodies expire after ttl
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    await cache.get("a", "1", load)
+    assert cache.misses["a"] == 4
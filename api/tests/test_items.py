@@ -1,13 +1,18 @@
+import hashlib
+import os
 import pytest
 import datetime
-from uuid import uuid4
-from unittest.mock import patch, MagicMock
+from uuid import UUID, uuid4
+from unittest.mock import patch
 import io
 
 
 @pytest.mark.asyncio
-async def test_upload_items(admin_client, db_session):
+async def test_upload_items(admin_client, db_session, tmp_path, monkeypatch):
     from app.db import models
+    from app.uploads import resumable_uploads
+
+    monkeypatch.chdir(tmp_path)
 
     album_id = uuid4()
     db_album = models.Album(
@@ -20,20 +25,28 @@ async def test_upload_items(admin_client, db_session):
     file_content = b"fake image content"
     file = io.BytesIO(file_content)
 
-    # Mock the internal create_item calls to avoid ffmpeg/PIL dependencies
-    mock_item = MagicMock(spec=models.Item)
-    mock_item.id = uuid4()
-    mock_item.album_id = album_id
-    mock_item.path = "data/items/test/item.jpg"
-    mock_item.cover_path = "data/items/test/cover.jpg"
-    mock_item.width = 100
-    mock_item.height = 100
-    mock_item.type = models.Type.IMAGE
-    mock_item.date = None
-
-    with patch("app.db.crud.create_item", return_value=mock_item):
-        mock_item.user = "test_user"
-        mock_item.date = datetime.datetime.now()
+    # Mock staging to avoid ffmpeg/PIL dependencies
+    staged = resumable_uploads.temporary_path()
+    with open(staged, "wb") as buffer:
+        buffer.write(file_content)
+    staged_item = models.Item(
+        id=uuid4(),
+        user="test_user",
+        album_id=album_id,
+        path=staged,
+        cover_path=staged,
+        width=100,
+        height=100,
+        type=models.Type.IMAGE,
+        date=datetime.datetime.now(),
+        processed=False,
+        content_hash=hashlib.sha256(file_content).hexdigest(),
+    )
+    item_id = staged_item.id
+
+    with patch("app.db.crud.stage_item", return_value=staged_item), patch(
+        "app.main.processing_queue"
+    ) as mock_queue:
         files = [("items", ("test.jpg", file, "image/jpeg"))]
         response = await admin_client.post(
             f"/items/{album_id}",
@@ -43,8 +56,12 @@ async def test_upload_items(admin_client, db_session):
 
     assert response.status_code == 200
     data = response.json()
-    assert len(data) == 1
-    assert data[0]["id"] == str(mock_item.id)
+    assert len(data["items"]) == 1
+    assert data["items"][0]["id"] == str(item_id)
+    assert data["failed"] == []
+    mock_queue.submit.assert_called_once_with(item_id)
+    # moved to storage, the upload folder is cleaned after upload_ttl
+    assert os.listdir("data/uploads") == []
 
 
 @pytest.mark.asyncio
@@ -130,3 +147,1124 @@ async def test_delete_items(admin_client, db_session):
     mock_remove.assert_any_call(db_item.cover_path)
     # Verify os.rmdir was called for the item directory
     mock_rmdir.assert_called_once_with(f"data/items/{album_id}/{item_id}")
+
+
+@pytest.mark.asyncio
+async def test_processing_queue_processes_image(db_session, session_factory, tmp_path):
+    from PIL import Image
+
+    from app.db import models
+    from app.worker import ProcessingQueue
+
+    item_id = uuid4()
+    source = tmp_path / "original"
+    Image.new("RGB", (800, 600), "red").save(source, format="JPEG")
+    db_session.add(
+        models.Item(
+            id=item_id,
+            path=str(source),
+            cover_path=str(source),
+            type=models.Type.IMAGE,
+            width="800",
+            height="600",
+            processed=False,
+        )
+    )
+    await db_session.commit()
+
+    # without start() the conversion runs in the default executor
+    await ProcessingQueue(session_factory, 1).process(item_id)
+
+    db_session.expire_all()
+    db_item = await db_session.get(models.Item, item_id)
+    assert db_item.processed
+    assert db_item.cover_path == f"{tmp_path}/cover.jpg"
+    assert db_item.path == f"{tmp_path}/item.jpg"
+    assert not source.exists()
+    with Image.open(db_item.cover_path) as cover:
+        assert cover.size == (400, 300)
+    # widths at or above the image width are not generated
+    assert db_item.widths == [200, 400]
+    with Image.open(tmp_path / "200.jpg") as derivative:
+        assert derivative.size == (200, 150)
+    assert db_item.formats == ["webp"]
+    for name in ("cover", "item", "200", "400"):
+        with Image.open(tmp_path / f"{name}.webp") as alternate:
+            assert alternate.format == "WEBP"
+    assert db_item.size == sum(file.stat().st_size for file in tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_processing_queue_keeps_files_written_over_source(
+    db_session, session_factory, tmp_path
+):
+    from PIL import Image
+
+    from app.db import models
+    from app.worker import ProcessingQueue
+
+    # items stored before the worker have their original at item.jpg
+    item_id = uuid4()
+    source = tmp_path / "item.jpg"
+    Image.new("RGB", (800, 600), "red").save(source, format="JPEG")
+    db_session.add(
+        models.Item(
+            id=item_id,
+            path=str(source),
+            cover_path=str(tmp_path / "cover.jpg"),
+            type=models.Type.IMAGE,
+            width="800",
+            height="600",
+            processed=False,
+        )
+    )
+    await db_session.commit()
+
+    await ProcessingQueue(session_factory, 1).process(item_id)
+
+    db_session.expire_all()
+    db_item = await db_session.get(models.Item, item_id)
+    assert db_item.processed
+    assert db_item.path == str(source)
+    with Image.open(source) as img:
+        assert img.size == (800, 600)
+
+
+def test_process_image_applies_orientation(tmp_path):
+    from PIL import ExifTags, Image
+
+    from app import processing
+
+    source = tmp_path / "original"
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    Image.new("RGB", (800, 600), "red").save(source, format="JPEG", exif=exif)
+
+    # the stored size is the displayed one, rotated by 90 degrees
+    assert processing.probe_image(str(source), 1_000_000) == (600, 800)
+    values = processing.process_image(str(source), str(tmp_path), [200, 400], [])
+    assert (values["width"], values["height"]) == ("600", "800")
+    assert values["widths"] == [200, 400]
+    with Image.open(tmp_path / "item.jpg") as img:
+        assert img.size == (600, 800)
+        assert ExifTags.Base.Orientation not in img.getexif()
+    with Image.open(tmp_path / "cover.jpg") as cover:
+        assert cover.size == (400, 533)
+    with Image.open(tmp_path / "200.jpg") as derivative:
+        assert derivative.size == (200, 266)
+
+    with pytest.raises(processing.ImageTooLarge):
+        processing.probe_image(str(source), 479_999)
+    with pytest.raises(processing.ImageTooLarge):
+        processing.process_image(str(source), str(tmp_path), [], [], 479_999)
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_large_images(
+    admin_client, db_session, tmp_path, monkeypatch
+):
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    monkeypatch.setattr("app.db.crud.settings.max_image_pixels", 100)
+
+    files = [("items", ("large.jpg", jpeg_bytes((20, 10)), "image/jpeg"))]
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(f"/items/{album_id}", files=files)
+
+    assert response.json()["failed"] == [
+        {"filename": "large.jpg", "detail": "Image is too large"}
+    ]
+    assert stored_paths(tmp_path) == []
+    assert os.listdir(tmp_path / "data" / "uploads") == []
+
+
+@pytest.mark.asyncio
+async def test_get_item_status(admin_client, db_session):
+    from app.db import models
+
+    item_id = uuid4()
+    db_session.add(
+        models.Item(
+            id=item_id,
+            path="data/items/original",
+            cover_path="data/items/original",
+            type=models.Type.VIDEO,
+            width="100",
+            height="100",
+            processed=False,
+        )
+    )
+    await db_session.commit()
+
+    response = await admin_client.get(f"/items/{item_id}/status")
+
+    assert response.status_code == 200
+    assert response.json() == {"id": str(item_id), "processed": False}
+
+    response = await admin_client.get(f"/items/{uuid4()}/status")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stage_upload(tmp_path):
+    import hashlib
+
+    from fastapi import UploadFile
+
+    from app.uploads import UploadTooLarge, stage_upload
+
+    content = b"x" * (3 * 1024 * 1024 + 5)
+    path = tmp_path / "original"
+
+    digest = await stage_upload(
+        UploadFile(io.BytesIO(content), filename="a.jpg"), str(path), len(content)
+    )
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert path.read_bytes() == content
+
+    with pytest.raises(UploadTooLarge):
+        await stage_upload(
+            UploadFile(io.BytesIO(content), filename="a.jpg"), str(path), 1024
+        )
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_upload_stores_original(admin_client, db_session, tmp_path, monkeypatch):
+    from PIL import Image
+
+    from app.db import models
+
+    monkeypatch.chdir(tmp_path)
+    album_id = uuid4()
+    (tmp_path / "data" / "items" / str(album_id)).mkdir(parents=True)
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+
+    image = io.BytesIO()
+    Image.new("RGB", (640, 480), "blue").save(image, format="PNG")
+    image.seek(0)
+    with patch("app.main.processing_queue") as mock_queue:
+        response = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", ("test.png", image, "image/png")),
+                ("items", ("notes.txt", io.BytesIO(b"text"), "text/plain")),
+            ],
+        )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["items"]) == 1
+    item = data["items"][0]
+    assert item["processed"] is False
+    assert (item["width"], item["height"]) == (640, 480)
+    assert data["failed"] == [
+        {"filename": "notes.txt", "detail": "Unsupported file type"}
+    ]
+    mock_queue.submit.assert_called_once()
+    # stored by the hash of its content, the album is only in the database
+    original = tmp_path / stored_original(image.getvalue(), item["id"])
+    assert original.read_bytes() == image.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_upload_reports_unreadable_files(
+    admin_client, db_session, tmp_path, monkeypatch
+):
+    from PIL import Image
+
+    from app.db import models
+
+    monkeypatch.chdir(tmp_path)
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+
+    files = []
+    for i in range(3):
+        image = io.BytesIO()
+        Image.new("RGB", (10 + i, 10), "blue").save(image, format="JPEG")
+        files.append(("items", (f"{i}.jpg", image.getvalue(), "image/jpeg")))
+    files.append(("items", ("broken.jpg", b"not an image", "image/jpeg")))
+
+    with patch("app.main.processing_queue") as mock_queue:
+        response = await admin_client.post(f"/items/{album_id}", files=files)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert sorted(item["width"] for item in data["items"]) == [10, 11, 12]
+    assert data["failed"] == [
+        {"filename": "broken.jpg", "detail": "Could not read file"}
+    ]
+    assert mock_queue.submit.call_count == 3
+    # the rejected upload leaves nothing behind
+    assert len(stored_paths(tmp_path)) == 3
+    assert list((tmp_path / "data" / "uploads").iterdir()) == []
+
+
+def stored_original(content: bytes, item_id: str) -> str:
+    content_hash = hashlib.sha256(content).hexdigest()
+    shard = f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+    return f"data/items/{shard}/{item_id}/original"
+
+
+def stored_paths(tmp_path) -> list[str]:
+    return sorted(
+        path.relative_to(tmp_path).as_posix()
+        for path in (tmp_path / "data" / "items").rglob("*")
+        if path.is_file()
+    )
+
+
+def jpeg_bytes(size=(16, 16), color="blue"):
+    from PIL import Image
+
+    image = io.BytesIO()
+    Image.new("RGB", size, color).save(image, format="JPEG")
+    return image.getvalue()
+
+
+async def create_upload_album(db_session, tmp_path, monkeypatch):
+    from app.db import models
+
+    monkeypatch.chdir(tmp_path)
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+
+    return album_id
+
+
+@pytest.mark.asyncio
+async def test_upload_skips_duplicates(admin_client, db_session, tmp_path, monkeypatch):
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photo = jpeg_bytes()
+
+    with patch("app.main.processing_queue"):
+        first = await admin_client.post(
+            f"/items/{album_id}", files=[("items", ("a.jpg", photo, "image/jpeg"))]
+        )
+        second = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", ("b.jpg", photo, "image/jpeg")),
+                ("items", ("c.jpg", jpeg_bytes(color="red"), "image/jpeg")),
+            ],
+        )
+
+    assert len(first.json()["items"]) == 1
+    data = second.json()
+    assert len(data["items"]) == 1
+    assert data["failed"] == [
+        {"filename": "b.jpg", "detail": "Duplicate of an existing item"}
+    ]
+    assert len(stored_paths(tmp_path)) == 2
+
+
+@pytest.mark.asyncio
+async def test_upload_links_duplicates(admin_client, db_session, tmp_path, monkeypatch):
+    from sqlalchemy import select
+
+    from app.db import models
+
+    monkeypatch.setattr("app.conf.settings.duplicate_uploads", "link")
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photo = jpeg_bytes()
+
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", ("a.jpg", photo, "image/jpeg")),
+                ("items", ("b.jpg", photo, "image/jpeg")),
+            ],
+        )
+
+    item_ids = [item["id"] for item in response.json()["items"]]
+    assert len(item_ids) == 2
+    result = await db_session.execute(select(models.Item))
+    paths = {db_item.path for db_item in result.scalars()}
+    assert len(paths) == 1
+    shared = tmp_path / paths.pop()
+    assert shared.exists()
+
+    # the files stay until the last item referring to them is deleted
+    response = await admin_client.post(f"/items/{album_id}/delete", json=[item_ids[0]])
+    assert response.status_code == 200
+    assert shared.exists()
+
+    response = await admin_client.post(f"/items/{album_id}/delete", json=[item_ids[1]])
+    assert response.status_code == 200
+    assert not shared.exists()
+    assert stored_paths(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_duplicate_of_item_processed_meanwhile(
+    admin_client, db_session, session_factory, tmp_path, monkeypatch
+):
+    from app.db import crud, models
+    from app.worker import ProcessingQueue
+
+    monkeypatch.setattr("app.conf.settings.duplicate_uploads", "link")
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photo = jpeg_bytes((800, 600))
+    files = [("items", ("a.jpg", photo, "image/jpeg"))]
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(f"/items/{album_id}", files=files)
+    original_id = UUID(response.json()["items"][0]["id"])
+
+    # the worker replaces the original after the duplicate looked it up
+    resolve_duplicates = crud.resolve_duplicates
+
+    async def resolve_then_process(*args):
+        resolved = await resolve_duplicates(*args)
+        await ProcessingQueue(session_factory, 1).process(original_id)
+        return resolved
+
+    monkeypatch.setattr("app.db.crud.resolve_duplicates", resolve_then_process)
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(f"/items/{album_id}", files=files)
+
+    assert response.json()["items"][0]["processed"]
+    db_session.expire_all()
+    original = await db_session.get(models.Item, original_id)
+    duplicate = await db_session.get(
+        models.Item, UUID(response.json()["items"][0]["id"])
+    )
+    assert duplicate.path == original.path
+    assert duplicate.path.endswith("/item.jpg")
+    assert (tmp_path / duplicate.path).exists()
+    assert os.listdir(tmp_path / "data" / "uploads") == []
+
+
+async def stage_photo(album_id, content: bytes):
+    from app.db import crud
+
+    async def store(path: str) -> str:
+        with open(path, "wb") as buffer:
+            buffer.write(content)
+        return hashlib.sha256(content).hexdigest()
+
+    return await crud.stage_original(None, "image/jpeg", album_id, store)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_of_item_deleted_meanwhile(
+    db_session, session_factory, tmp_path, monkeypatch
+):
+    from app.db import crud
+
+    monkeypatch.setattr("app.conf.settings.duplicate_uploads", "link")
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photo = jpeg_bytes()
+    original = await crud.add_item(
+        db_session, album_id, "a.jpg", await stage_photo(album_id, photo)
+    )
+    original_path = original.path
+
+    # the original is deleted after the duplicate looked it up
+    resolve_duplicates = crud.resolve_duplicates
+
+    async def resolve_then_delete(*args):
+        resolved = await resolve_duplicates(*args)
+        async with session_factory() as db:
+            await crud.delete_items(db, None, album_id, [original.id])
+        return resolved
+
+    monkeypatch.setattr("app.db.crud.resolve_duplicates", resolve_then_delete)
+    duplicate = await crud.add_item(
+        db_session, album_id, "b.jpg", await stage_photo(album_id, photo)
+    )
+
+    assert not (tmp_path / original_path).exists()
+    assert duplicate.path != original_path
+    assert (tmp_path / duplicate.path).read_bytes() == photo
+    assert stored_paths(tmp_path) == [duplicate.path]
+
+
+@pytest.mark.asyncio
+async def test_rollback_keeps_copy_stored_meanwhile(
+    db_session, session_factory, tmp_path, monkeypatch
+):
+    from sqlalchemy import select
+
+    from app.db import crud, models
+
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photo = jpeg_bytes()
+
+    # another request stores the same content while this one is inserted, then
+    # this one fails and rolls back
+    resolve_duplicates = crud.resolve_duplicates
+
+    async def failing_summaries(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    async def resolve_then_store(*args):
+        resolved = await resolve_duplicates(*args)
+        monkeypatch.setattr("app.db.crud.resolve_duplicates", resolve_duplicates)
+        async with session_factory() as db:
+            await crud.add_item(
+                db, album_id, "b.jpg", await stage_photo(album_id, photo)
+            )
+        monkeypatch.setattr("app.db.crud.update_album_summaries", failing_summaries)
+        return resolved
+
+    monkeypatch.setattr("app.db.crud.resolve_duplicates", resolve_then_store)
+    with pytest.raises(RuntimeError):
+        await crud.add_item(
+            db_session, album_id, "a.jpg", await stage_photo(album_id, photo)
+        )
+
+    result = await db_session.execute(select(models.Item.path))
+    assert stored_paths(tmp_path) == result.scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_delete_album_with_items(admin_client, db_session, tmp_path, monkeypatch):
+    from sqlalchemy import select
+
+    from app.db import models
+
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", (f"{color}.jpg", jpeg_bytes(color=color), "image/jpeg"))
+                for color in ("red", "green", "blue")
+            ],
+        )
+    item_ids = [UUID(item["id"]) for item in response.json()["items"]]
+
+    smoel_id = uuid4()
+    db_session.add(models.Smoel(id=smoel_id, name="Smoel", preview_id=item_ids[0]))
+    await db_session.execute(
+        models.association_table.insert().values(item_id=item_ids[0], smoel_id=smoel_id)
+    )
+    await db_session.commit()
+
+    # a file that can not be removed must not keep its row around
+    green = hashlib.sha256(jpeg_bytes(color="green")).hexdigest()
+    result = await db_session.execute(
+        select(models.Item.path).where(models.Item.content_hash == green)
+    )
+    stuck = result.scalar_one()
+    remove = os.remove
+
+    def failing_remove(path):
+        if path == stuck:
+            raise PermissionError(path)
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", failing_remove)
+    response = await admin_client.delete(f"/albums/{album_id}")
+
+    assert response.status_code == 200
+    result = await db_session.execute(select(models.Item.id))
+    assert result.scalars().all() == []
+    result = await db_session.execute(select(models.association_table))
+    assert result.all() == []
+    db_smoel = await db_session.get(models.Smoel, smoel_id)
+    await db_session.refresh(db_smoel)
+    assert db_smoel.preview_id is None
+    assert await db_session.get(models.Album, album_id) is None
+
+    remaining = [
+        path.relative_to(tmp_path).as_posix()
+        for path in (tmp_path / "data").rglob("*")
+        if path.is_file()
+    ]
+    assert remaining == [stuck]
+
+
+@pytest.mark.asyncio
+async def test_album_summary(
+    admin_client, db_session, session_factory, tmp_path, monkeypatch
+):
+    from app.worker import ProcessingQueue
+
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    photos = [jpeg_bytes(color=color) for color in ("red", "green")]
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", (f"{i}.jpg", photo, "image/jpeg"))
+                for i, photo in enumerate(photos)
+            ],
+        )
+    items = response.json()["items"]
+
+    response = await admin_client.get("/albums")
+    album = response.json()[0]
+    assert album["item_count"] == 2
+    assert album["image_count"] == 2
+    assert album["video_count"] == 0
+    assert album["total_bytes"] == sum(len(photo) for photo in photos)
+    assert album["newest_date"] == max(item["date"] for item in items)
+
+    # processing replaces the original by the optimized files
+    await ProcessingQueue(session_factory, 1).process(UUID(items[0]["id"]))
+    response = await admin_client.get("/albums")
+    stored = sum(os.path.getsize(path) for path in stored_paths(tmp_path))
+    assert response.json()[0]["total_bytes"] == stored
+
+    await admin_client.post(f"/items/{album_id}/delete", json=[items[0]["id"]])
+    await admin_client.post(f"/items/{album_id}/delete", json=[items[1]["id"]])
+    response = await admin_client.get("/albums")
+    album = response.json()[0]
+    assert album["item_count"] == 0
+    assert album["image_count"] == 0
+    assert album["total_bytes"] == 0
+    assert album["newest_date"] is None
+
+
+@pytest.mark.asyncio
+async def test_move_items(admin_client, db_session, tmp_path, monkeypatch):
+    from app.db import models
+
+    album_id = await create_upload_album(db_session, tmp_path, monkeypatch)
+    target_id = uuid4()
+    db_session.add(models.Album(id=target_id, name="Target", description="", order=1))
+    await db_session.commit()
+    photos = [jpeg_bytes(color=color) for color in ("red", "green")]
+    with patch("app.main.processing_queue"):
+        response = await admin_client.post(
+            f"/items/{album_id}",
+            files=[
+                ("items", (f"{i}.jpg", photo, "image/jpeg"))
+                for i, photo in enumerate(photos)
+            ],
+        )
+    item_id, kept_id = (item["id"] for item in response.json()["items"])
+    stored = stored_paths(tmp_path)
+
+    response = await admin_client.post(
+        f"/items/{album_id}/move",
+        json={"album_id": str(uuid4()), "items": [item_id]},
+    )
+    assert response.status_code == 404
+
+    response = await admin_client.post(
+        f"/items/{album_id}/move", json={"album_id": str(target_id), "items": [item_id]}
+    )
+    assert response.status_code == 200
+    # the source album is returned, like after deleting items
+    assert [item["id"] for item in response.json()["items"]] == [kept_id]
+    # albums only exist in the database, the files stay where they are
+    assert stored_paths(tmp_path) == stored
+
+    response = await admin_client.get("/albums")
+    counts = {album["id"]: album["item_count"] for album in response.json()}
+    assert counts == {str(album_id): 1, str(target_id): 1}
+
+
+@pytest.mark.asyncio
+async def test_item_srcset(admin_client, db_session, tmp_path):
+    from PIL import Image
+
+    from app.db import models
+    from app.signing import current_expiry, sign_item_url
+
+    album_id = uuid4()
+    item_id = uuid4()
+    Image.new("RGB", (200, 150)).save(tmp_path / "200.jpg")
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    db_session.add(
+        models.Item(
+            id=item_id,
+            album_id=album_id,
+            path=f"{tmp_path}/item.jpg",
+            cover_path=f"{tmp_path}/cover.jpg",
+            type=models.Type.IMAGE,
+            width="800",
+            height="600",
+            processed=True,
+            widths=[200, 400],
+        )
+    )
+    await db_session.commit()
+
+    response = await admin_client.get(f"/albums/{album_id}")
+
+    srcset = response.json()["items"][0]["srcset"]
+    assert [source["width"] for source in srcset] == [200, 400, 800]
+    assert "/w/200?signature=" in srcset[0]["url"]
+    assert srcset[-1]["url"] == response.json()["items"][0]["path"]
+
+    response = await admin_client.get(srcset[0]["url"].removeprefix("https://test/api"))
+    assert response.status_code == 200
+    assert response.content == (tmp_path / "200.jpg").read_bytes()
+
+    url = sign_item_url(item_id, current_expiry(), "w/300")
+    response = await admin_client.get(url.removeprefix("https://test/api"))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_cover_negotiates_format(client, db_session, tmp_path):
+    from PIL import Image
+
+    from app.db import models
+    from app.signing import current_expiry, sign_item_url
+
+    item_id = uuid4()
+    Image.new("RGB", (40, 30)).save(tmp_path / "cover.jpg")
+    Image.new("RGB", (40, 30)).save(tmp_path / "cover.webp")
+    db_session.add(
+        models.Item(
+            id=item_id,
+            path=f"{tmp_path}/item.jpg",
+            cover_path=f"{tmp_path}/cover.jpg",
+            type=models.Type.IMAGE,
+            width="40",
+            height="30",
+            processed=True,
+            formats=["webp"],
+        )
+    )
+    await db_session.commit()
+    url = sign_item_url(item_id, current_expiry(), "cover")
+    url = url.removeprefix("https://test/api")
+
+    response = await client.get(
+        url, headers={"Accept": "image/avif,image/webp,image/*;q=0.8"}
+    )
+    assert response.headers["content-type"] == "image/webp"
+    assert "Accept" in response.headers["vary"]
+    assert response.content == (tmp_path / "cover.webp").read_bytes()
+
+    response = await client.get(url, headers={"Accept": "image/webp;q=0, */*"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "Accept" in response.headers["vary"]
+
+
+def test_preferred_format():
+    from app.fileresponse import preferred_format
+
+    accept = "image/avif,image/webp,image/apng,*/*;q=0.8"
+    assert preferred_format(accept, ["avif", "webp"]) == "avif"
+    assert preferred_format(accept, ["webp"]) == "webp"
+    assert preferred_format("image/*", ["webp"]) is None
+    assert preferred_format("image/webp; q=0", ["webp"]) is None
+    assert preferred_format("", ["webp"]) is None
+
+
+@pytest.mark.asyncio
+async def test_media_served_from_cache(admin_client, db_session, mock_media_cache):
+    from app.db import models
+
+    album_id = uuid4()
+    item_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    db_session.add(
+        models.Item(
+            id=item_id,
+            album_id=album_id,
+            path="tests/conftest.py",
+            cover_path="tests/conftest.py",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+        )
+    )
+    await db_session.commit()
+
+    response = await admin_client.get(f"/albums/{album_id}")
+    cover_url = response.json()["items"][0]["cover_path"]
+
+    response = await admin_client.get(cover_url.removeprefix("https://test/api"))
+    assert response.status_code == 200
+    # signing the album cached the paths, serving needed no query
+    assert (mock_media_cache.hits, mock_media_cache.misses) == (1, 0)
+
+    with patch("os.remove"), patch("os.rmdir"):
+        await admin_client.post(f"/items/{album_id}/delete", json=[str(item_id)])
+
+    response = await admin_client.get(cover_url.removeprefix("https://test/api"))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_media_cache_reloads_missing_files(client, db_session, mock_media_cache):
+    from app.db import models
+    from app.signing import current_expiry, sign_item_url
+
+    item_id = uuid4()
+    db_item = models.Item(
+        id=item_id,
+        path="tests/conftest.py",
+        cover_path="tests/conftest.py",
+        type=models.Type.IMAGE,
+        width="100",
+        height="100",
+    )
+    db_session.add(db_item)
+    await db_session.commit()
+    # cached before another worker finished processing the item
+    mock_media_cache.prime(
+        models.Item(id=item_id, path="tests/original", cover_path="tests/original")
+    )
+
+    url = sign_item_url(item_id, current_expiry(), "full")
+    response = await client.get(url.removeprefix("https://test/api"))
+
+    assert response.status_code == 200
+    assert response.content == open("tests/conftest.py", "rb").read()
+
+
+async def add_processed_item(db_session, path, processed=True):
+    from app.db import models
+
+    item_id = uuid4()
+    db_session.add(
+        models.Item(
+            id=item_id,
+            path=str(path),
+            cover_path=str(path),
+            type=models.Type.VIDEO,
+            width="100",
+            height="100",
+            processed=processed,
+        )
+    )
+    await db_session.commit()
+
+    return item_id
+
+
+def signed_path(item_id, kind="full"):
+    from app.signing import current_expiry, sign_item_url
+
+    url = sign_item_url(item_id, current_expiry(), kind)
+    return url.removeprefix("https://test/api")
+
+
+@pytest.mark.asyncio
+async def test_media_caching_headers(client, db_session, tmp_path):
+    video = tmp_path / "item.mp4"
+    video.write_bytes(b"0123456789" * 100)
+    item_id = await add_processed_item(db_session, video)
+
+    response = await client.get(signed_path(item_id))
+    assert response.status_code == 200
+    cache_control = response.headers["cache-control"]
+    assert cache_control.startswith("private, max-age=")
+    assert cache_control.endswith(", immutable")
+    stat = video.stat()
+    etag = f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    assert response.headers["etag"] == etag
+
+    response = await client.get(signed_path(item_id), headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == cache_control
+
+    response = await client.get(
+        signed_path(item_id),
+        headers={"If-Modified-Since": response.headers["last-modified"]},
+    )
+    assert response.status_code == 304
+
+    response = await client.get(
+        signed_path(item_id), headers={"If-None-Match": '"other"'}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_media_range_requests(client, db_session, tmp_path):
+    video = tmp_path / "item.mp4"
+    video.write_bytes(bytes(range(256)) * 4)
+    item_id = await add_processed_item(db_session, video)
+
+    response = await client.get(signed_path(item_id), headers={"Range": "bytes=512-"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 512-1023/1024"
+    assert response.content == video.read_bytes()[512:]
+
+    response = await client.get(signed_path(item_id), headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == video.read_bytes()[10:20]
+
+
+@pytest.mark.asyncio
+async def test_unprocessed_media_is_not_immutable(client, db_session, tmp_path):
+    original = tmp_path / "original"
+    original.write_bytes(b"original")
+    item_id = await add_processed_item(db_session, original, processed=False)
+
+    response = await client.get(signed_path(item_id))
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, no-cache"
+    # the cover of a video only exists once processed
+    response = await client.get(signed_path(item_id, "cover"))
+    assert response.status_code == 404
+
+
+class AccelRedirectProxy:
+    """Stands in for nginx, sends the file an X-Accel-Redirect points at."""
+
+    def __init__(self, app, prefix, root):
+        self.app = app
+        self.prefix = prefix
+        self.root = root
+
+    async def __call__(self, scope, receive, send):
+        start = {}
+
+        async def intercept(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+                return
+
+            headers = dict(start["headers"])
+            redirect = headers.get(b"x-accel-redirect")
+            if redirect is None:
+                await send(start)
+                await send(message)
+                return
+
+            path = redirect.decode().removeprefix(self.prefix)
+            body = (self.root / path).read_bytes()
+            await send(
+                {**start, "headers": [(b"content-type", headers[b"content-type"])]}
+            )
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, intercept)
+
+
+@pytest.mark.asyncio
+async def test_media_delivery_by_proxy(db_session, tmp_path, monkeypatch):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.main import app
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("app.conf.settings.media_delivery", "x-accel-redirect")
+    folder = tmp_path / "data" / "items" / "album"
+    folder.mkdir(parents=True)
+    (folder / "item.mp4").write_bytes(b"video bytes")
+    item_id = await add_processed_item(db_session, "data/items/album/item.mp4")
+
+    proxy = AccelRedirectProxy(app, "/internal/", tmp_path / "data")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as api, AsyncClient(
+        transport=ASGITransport(app=proxy), base_url="http://test"
+    ) as proxied:
+        response = await api.get(signed_path(item_id))
+        assert response.status_code == 200
+        assert response.headers["x-accel-redirect"] == "/internal/items/album/item.mp4"
+        assert response.headers["content-type"] == "video/mp4"
+        assert response.content == b""
+
+        response = await proxied.get(signed_path(item_id))
+        assert response.status_code == 200
+        assert response.content == b"video bytes"
+
+    monkeypatch.setattr("app.conf.settings.media_delivery", "x-sendfile")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as api:
+        response = await api.get(signed_path(item_id))
+    assert response.headers["x-sendfile"] == str(folder / "item.mp4")
+
+
+@pytest.mark.asyncio
+async def test_hls_playlists_are_signed(client, db_session, tmp_path):
+    from app.db import models
+
+    folder = tmp_path / "hls"
+    folder.mkdir()
+    (folder / "master.m3u8").write_text(
+        "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=691200,RESOLUTION=640x360\n360p.m3u8\n"
+    )
+    (folder / "360p.m3u8").write_text(
+        "#EXTM3U\n#EXTINF:6.0,\n360p_000.ts\n#EXTINF:2.5,\n360p_001.ts\n"
+        "#EXT-X-ENDLIST\n"
+    )
+    for i in range(2):
+        (folder / f"360p_{i:03d}.ts").write_bytes(b"segment %d" % i)
+    (folder / "other.ts").write_bytes(b"not a segment")
+
+    item_id = await add_processed_item(db_session, tmp_path / "item.mp4")
+    db_item = await db_session.get(models.Item, item_id)
+    db_item.hls = {"360": 2}
+    await db_session.commit()
+
+    response = await client.get(signed_path(item_id, "hls/master.m3u8"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apple.mpegurl"
+    lines = response.text.splitlines()
+    assert lines[:2] == [
+        "#EXTM3U",
+        "#EXT-X-STREAM-INF:BANDWIDTH=691200,RESOLUTION=640x360",
+    ]
+    assert lines[2] == f"https://test/api{signed_path(item_id, 'hls/360p.m3u8')}"
+
+    response = await client.get(signed_path(item_id, "hls/360p.m3u8"))
+    segments = [line for line in response.text.splitlines() if "signature=" in line]
+    assert len(segments) == 2
+    response = await client.get(segments[1].removeprefix("https://test/api"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "video/mp2t"
+    assert response.content == b"segment 1"
+
+    # only the files of the renditions are served
+    for name in ("other.ts", "360p_002.ts", "..%2Fitem.mp4"):
+        response = await client.get(signed_path(item_id, f"hls/{name}"))
+        assert response.status_code == 404
+
+    response = await client.get(
+        signed_path(item_id, "hls/360p_000.ts").replace("360p_000", "360p_001")
+    )
+    assert response.json() is None
+
+
+def test_hls_stored_files():
+    from app import processing
+
+    files = processing.stored_files(
+        "data/items/a/b/item.mp4", "data/items/a/b/cover.jpg", [], [], {"360": 2}
+    )
+    assert files == {
+        "data/items/a/b/item.mp4",
+        "data/items/a/b/cover.jpg",
+        "data/items/a/b/hls/master.m3u8",
+        "data/items/a/b/hls/360p.m3u8",
+        "data/items/a/b/hls/360p_000.ts",
+        "data/items/a/b/hls/360p_001.ts",
+    }
+
+
+def video_probe(**video):
+    return {
+        "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "10.0"},
+        "streams": [
+            {"codec_type": "audio", "codec_name": "aac"},
+            {
+                "codec_type": "video",
+                "codec_name": "h264",
+                "pix_fmt": "yuv420p",
+                "width": 1920,
+                "height": 1080,
+                "bit_rate": "8000000",
+                **video,
+            },
+        ],
+    }
+
+
+def test_transcode_reason():
+    from app.processing import transcode_reason
+
+    assert transcode_reason(video_probe(), 12_000_000, 1080) is None
+    # portrait videos are limited by their short side too
+    assert (
+        transcode_reason(video_probe(width=1080, height=1920), 12_000_000, 1080) is None
+    )
+
+    assert transcode_reason(video_probe(codec_name="hevc"), 12_000_000, 1080) == (
+        "video codec hevc"
+    )
+    assert transcode_reason(video_probe(pix_fmt="yuv420p10le"), 12_000_000, 1080) == (
+        "pixel format yuv420p10le"
+    )
+    assert transcode_reason(video_probe(width=3840, height=2160), 12_000_000, 1080) == (
+        "resolution 3840x2160"
+    )
+    assert transcode_reason(video_probe(), 4_000_000, 1080) == "bitrate 8000000"
+
+    probe = video_probe()
+    probe["streams"][0]["codec_name"] = "pcm_s16le"
+    assert transcode_reason(probe, 12_000_000, 1080) == "audio codec pcm_s16le"
+    probe = video_probe()
+    probe["format"]["format_name"] = "matroska,webm"
+    assert transcode_reason(probe, 12_000_000, 1080) == "container matroska,webm"
+
+
+def test_remux_and_encode_commands():
+    import ffmpeg
+
+    from app import processing
+
+    def run(stream, **kwargs):
+        commands.append(ffmpeg.compile(stream, **kwargs))
+
+    commands = []
+    with patch("ffmpeg.run", run):
+        processing.remux_video("in.mov", "item.mp4", video_probe())
+        processing.encode_video(
+            "in.mov", "item.mp4", video_probe(width=3840, height=2160), 1080
+        )
+
+    remux, encode = commands
+    assert remux == [
+        "ffmpeg",
+        "-i",
+        "in.mov",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        "item.mp4",
+        "-y",
+    ]
+    assert "[0:v:0]scale=-2:1080[s0]" in encode
+    assert encode[encode.index("-vcodec") + 1] == "libx264"
+    assert encode[encode.index("-movflags") + 1] == "+faststart"
+
+
+def test_hls_overwrites_interrupted_attempt(tmp_path):
+    import ffmpeg
+
+    from app import processing
+
+    def run(stream, **kwargs):
+        assert "-y" in ffmpeg.compile(stream, **kwargs)
+        (tmp_path / "hls" / "720p_000.ts").write_bytes(b"segment")
+
+    # a restart during the first attempt left the folder behind
+    (tmp_path / "hls").mkdir()
+    (tmp_path / "hls" / "720p.m3u8").write_text("#EXTM3U")
+    with patch("ffmpeg.run", run):
+        segments = processing.create_hls(
+            "in.mov", str(tmp_path / "hls"), [720], video_probe()
+        )
+
+    assert segments == {"720": 1}
+    assert (tmp_path / "hls" / "master.m3u8").exists()
+
+
+def test_worker_logs_time_saved(caplog):
+    from app.worker import ProcessingQueue
+
+    queue = ProcessingQueue(None, 1)
+    with caplog.at_level("INFO", logger="app.worker"):
+        queue._log_transcode(
+            "a",
+            {
+                "action": "encode",
+                "reason": "video codec hevc",
+                "seconds": 20.0,
+                "duration": 10.0,
+            },
+        )
+        queue._log_transcode(
+            "b", {"action": "remux", "reason": None, "seconds": 1.0, "duration": 10.0}
+        )
+
+    assert caplog.messages == [
+        "Item a: re-encoded 10.0s of video in 20.0s (video codec hevc)",
+        "Item b: remuxed 10.0s of video in 1.0s, about 19.0s saved",
+    ]
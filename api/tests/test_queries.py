@@ -0,0 +1,89 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app.db import crud, models
+
+
+async def query_plans(db_session, call) -> list[tuple[str, list[str]]]:
+    """Run call and return each executed statement with its EXPLAIN QUERY PLAN."""
+    engine = db_session.bind.sync_engine
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        await call()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    conn = await db_session.connection()
+    plans = []
+    for statement, parameters in statements:
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plans.append((statement, [row[3] for row in result]))
+
+    return plans
+
+
+@pytest.mark.asyncio
+async def test_hot_queries_use_indexes(db_session):
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    smoel = models.Smoel(id=uuid4(), name="Smoel")
+    smoel.items = [
+        models.Item(
+            id=uuid4(),
+            album_id=album_id,
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE,
+            width="100",
+            height="100",
+        )
+        for _ in range(3)
+    ]
+    db_session.add(smoel)
+    await db_session.commit()
+
+    async def load():
+        await crud.get_album(db_session, album_id)
+        await crud.get_album(db_session, album_id, limit=2)
+        await crud.get_smoel_album(db_session, smoel.id)
+        await crud.get_smoel_album(db_session, smoel.id, limit=2)
+
+    plans = await query_plans(db_session, load)
+    details = [detail for _, plan in plans for detail in plan]
+
+    # no full table scans, every lookup is a search on an index
+    assert not [detail for detail in details if detail.startswith("SCAN")]
+    assert any("ix_items_album_id_date_id" in detail for detail in details)
+    assert any("ix_association_item_id_smoel_id" in detail for detail in details)
+    assert any("ix_association_smoel_id_item_id" in detail for detail in details)
+
+    # album items come out of the index already sorted
+    for statement, plan in plans:
+        if "items.album_id = ?" in statement or "items.album_id IN" in statement:
+            assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+
+@pytest.mark.asyncio
+async def test_smoel_tagged_once(db_session):
+    item_id, smoel_id = uuid4(), uuid4()
+    db_session.add(models.Item(id=item_id, path="tests/item.jpg"))
+    db_session.add(models.Smoel(id=smoel_id, name="Smoel"))
+    await db_session.commit()
+
+    insert = models.association_table.insert().values(
+        item_id=item_id, smoel_id=smoel_id
+    )
+    await db_session.execute(insert)
+    with pytest.raises(IntegrityError):
+        await db_session.execute(insert)
+    await db_session.rollback()
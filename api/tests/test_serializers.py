@@ -0,0 +1,53 @@
+import datetime
+import json
+from uuid import uuid4
+
+import pytest
+
+from app.db import crud, schemas, serializers
+
+
+@pytest.mark.asyncio
+async def test_serializers_match_schemas(db_session):
+    from app.db import models
+
+    album_id = uuid4()
+    items = [
+        models.Item(
+            id=uuid4(),
+            album_id=album_id,
+            user="119",
+            path="tests/item.jpg",
+            cover_path="tests/cover.jpg",
+            type=models.Type.IMAGE if i else models.Type.VIDEO,
+            width="1600",
+            height="1200",
+            processed=bool(i),
+            widths=[200, 400] if i else None,
+            date=datetime.datetime(2024, 1, 1, 12, 30, 15, 250 * i),
+        )
+        for i in range(3)
+    ]
+    smoel = models.Smoel(id=uuid4(), name="Smoel", preview=items[1], items=items[1:])
+    db_session.add(
+        models.Album(
+            id=album_id, name="Album", description="", order=0, preview=items[2]
+        )
+    )
+    db_session.add(smoel)
+    smoel_id = smoel.id
+    await db_session.commit()
+
+    def check(schema, value):
+        # same fields, in the same order, as pydantic would produce
+        expected = schema.model_validate(value).model_dump_json()
+        assert list(json.loads(serializers.dumps(value))) == list(json.loads(expected))
+        assert json.loads(serializers.dumps(value)) == json.loads(expected)
+
+    check(schemas.Album, await crud.get_album(db_session, album_id))
+    check(schemas.Album, await crud.get_album(db_session, album_id, limit=2))
+    check(schemas.SmoelAlbum, await crud.get_smoel_album(db_session, smoel_id))
+    for value in await crud.get_albums(db_session):
+        check(schemas.AlbumList, value)
+    for value in await crud.get_smoelen_albums(db_session):
+        check(schemas.SmoelAlbumList, value)
@@ -0,0 +1,82 @@
+import os
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from Crypto.PublicKey import RSA
+
+from app import signing
+
+
+def test_hmac_sign_and_verify():
+    url = "https://test/api/items/abc/1700000000.0/cover"
+    signed = signing.sign_url(url)
+
+    assert signed.startswith(f"{url}?signature=")
+    signature = signed.split("?signature=")[1]
+    assert signing.verify_url(url, signature)
+    assert not signing.verify_url(url.replace("cover", "full"), signature)
+    assert not signing.verify_url(url, "not hex")
+
+
+def test_rsa_backend_roundtrip():
+    key = RSA.generate(1024)
+    backend = signing.RSABackend(
+        key.export_key().decode(), key.publickey().export_key().decode()
+    )
+
+    signature = backend.sign(b"message")
+    assert backend.verify(b"message", signature)
+    assert not backend.verify(b"other message", signature)
+
+
+def test_load_hmac_key_is_persistent(tmp_path):
+    path = str(tmp_path / "signing.key")
+
+    key = signing.load_hmac_key(path)
+    assert len(key) == 32
+    assert signing.load_hmac_key(path) == key
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_load_hmac_key_concurrent_and_truncated(tmp_path):
+    path = tmp_path / "signing.key"
+    path.write_bytes(b"k" * 32)
+
+    # another process created the key after the check, its key is used
+    with patch("app.signing.os.path.exists", return_value=False):
+        assert signing.load_hmac_key(str(path)) == b"k" * 32
+    assert os.listdir(tmp_path) == ["signing.key"]
+
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        signing.load_hmac_key(str(path))
+
+
+def test_verify_signature_uses_backend():
+    from app.main import verify_signature
+
+    signed = signing.sign_url("https://test/api/items/abc/1.0/full")
+    url, signature = signed.split("?signature=")
+    assert verify_signature(url, signature)
+
+
+def test_expiry_is_bucketed(monkeypatch):
+    monkeypatch.setattr(signing.settings, "signature_bucket", 100)
+
+    assert signing.current_expiry(1000) == 1200.0
+    assert signing.current_expiry(1099.9) == 1200.0
+    assert signing.current_expiry(1100) == 1300.0
+
+
+def test_item_urls_are_stable_within_bucket():
+    item_id = uuid4()
+    expiry = signing.current_expiry()
+
+    first = signing.sign_item_url(item_id, expiry, "cover")
+    second = signing.sign_item_url(item_id, expiry, "cover")
+
+    assert first == second
+    assert f"/items/{item_id}/{expiry}/cover?signature=" in first
+    # the second url comes from the cache without signing again
+    assert signing.get_backend.call_count == 1
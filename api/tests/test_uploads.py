@@ -0,0 +1,240 @@
+import hashlib
+import io
+import os
+import time
+from unittest.mock import patch
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import select
+
+from app.uploads import ResumableUploads, UploadConflict, UploadNotFound
+
+
+def jpeg_bytes() -> bytes:
+    from PIL import Image
+
+    image = io.BytesIO()
+    Image.new("RGB", (64, 48), "green").save(image, format="JPEG")
+    return image.getvalue()
+
+
+async def chunks(*values: bytes):
+    for value in values:
+        yield value
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    uploads = ResumableUploads("data/uploads", ttl=60, max_size=1024 * 1024)
+    monkeypatch.setattr("app.main.resumable_uploads", uploads)
+    monkeypatch.setattr("app.db.crud.resumable_uploads", uploads)
+    return uploads
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload(admin_client, db_session, uploads, tmp_path):
+    from app.db import models
+
+    album_id = uuid4()
+    (tmp_path / "data" / "items" / str(album_id)).mkdir(parents=True)
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+    content = jpeg_bytes()
+
+    response = await admin_client.post(
+        "/uploads",
+        json={
+            "album_id": str(album_id),
+            "filename": "photo.jpg",
+            "content_type": "image/jpeg",
+            "size": len(content),
+        },
+    )
+    assert response.status_code == 201
+    upload_id = response.json()["id"]
+    assert response.json()["offset"] == 0
+
+    response = await admin_client.patch(
+        f"/uploads/{upload_id}", content=content[:100], headers={"Upload-Offset": "0"}
+    )
+    assert response.json()["offset"] == 100
+
+    # a chunk sent again after a dropped connection does not match the offset
+    response = await admin_client.patch(
+        f"/uploads/{upload_id}", content=content[:100], headers={"Upload-Offset": "0"}
+    )
+    assert response.status_code == 409
+    response = await admin_client.post(f"/uploads/{upload_id}/finish")
+    assert response.status_code == 409
+
+    response = await admin_client.get(f"/uploads/{upload_id}")
+    offset = response.json()["offset"]
+    response = await admin_client.patch(
+        f"/uploads/{upload_id}",
+        content=content[offset:],
+        headers={"Upload-Offset": str(offset)},
+    )
+    assert response.json()["offset"] == len(content)
+
+    with patch("app.main.processing_queue") as mock_queue:
+        response = await admin_client.post(f"/uploads/{upload_id}/finish")
+    assert response.status_code == 200
+    item = response.json()["items"][0]
+    assert (item["width"], item["height"]) == (64, 48)
+    mock_queue.submit.assert_called_once()
+
+    db_item = await db_session.get(models.Item, UUID(item["id"]))
+    assert db_item.content_hash == hashlib.sha256(content).hexdigest()
+    with open(db_item.path, "rb") as file:
+        assert file.read() == content
+    assert os.listdir("data/uploads") == []
+    response = await admin_client.get(f"/uploads/{upload_id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_create_upload_rejections(admin_client, db_session, uploads):
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+    upload = {"album_id": str(album_id), "content_type": "image/jpeg", "size": 10}
+
+    response = await admin_client.post(
+        "/uploads", json={**upload, "content_type": "text/plain"}
+    )
+    assert response.status_code == 400
+    response = await admin_client.post("/uploads", json={**upload, "size": 2**21})
+    assert response.status_code == 413
+    response = await admin_client.post(
+        "/uploads", json={**upload, "album_id": str(uuid4())}
+    )
+    assert response.status_code == 404
+
+    response = await admin_client.post("/uploads", json=upload)
+    upload_id = response.json()["id"]
+    response = await admin_client.patch(
+        f"/uploads/{upload_id}", content=b"x" * 11, headers={"Upload-Offset": "0"}
+    )
+    assert response.status_code == 413
+    response = await admin_client.delete(f"/uploads/{upload_id}")
+    assert response.json() == {"success": True}
+    assert os.listdir("data/uploads") == []
+
+
+@pytest.mark.asyncio
+async def test_upload_resumes_after_restart(uploads):
+    upload = await uploads.create(None, "user", "a.jpg", "image/jpeg", 6)
+    await uploads.write(upload.id, "user", 0, chunks(b"abc"))
+
+    # the offset is read from disk, the digest from the file once complete
+    restarted = ResumableUploads("data/uploads", ttl=60, max_size=1024)
+    assert restarted.get(upload.id, "user").offset == 3
+    await restarted.write(upload.id, "user", 3, chunks(b"de", b"f"))
+    digest = await restarted.take(upload.id, "user", "taken")
+    assert digest == hashlib.sha256(b"abcdef").hexdigest()
+
+    with pytest.raises(UploadNotFound):
+        restarted.get(upload.id, "user")
+
+
+@pytest.mark.asyncio
+async def test_upload_failed_chunk_is_discarded(uploads):
+    upload = await uploads.create(None, "user", "a.jpg", "image/jpeg", 6)
+
+    async def dropped():
+        yield b"abc"
+        raise ConnectionError()
+
+    with patch("app.uploads.CHUNK_SIZE", 2):
+        with pytest.raises(ConnectionError):
+            await uploads.write(upload.id, "user", 0, dropped())
+    assert uploads.get(upload.id, "user").offset == 3
+
+    await uploads.write(upload.id, "user", 3, chunks(b"def"))
+    digest = await uploads.take(upload.id, "user", "taken")
+    assert digest == hashlib.sha256(b"abcdef").hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_uploads_are_private_and_exclusive(uploads):
+    upload = await uploads.create(None, "user", "a.jpg", "image/jpeg", 6)
+
+    with pytest.raises(UploadNotFound):
+        uploads.get(upload.id, "someone else")
+    with pytest.raises(UploadNotFound):
+        await uploads.write(upload.id, "someone else", 0, chunks(b"abc"))
+
+    async def slow():
+        yield b"a"
+        with pytest.raises(UploadConflict):
+            await uploads.write(upload.id, "user", 0, chunks(b"abc"))
+        yield b"b"
+
+    await uploads.write(upload.id, "user", 0, slow())
+    assert uploads.get(upload.id, "user").offset == 2
+
+
+@pytest.mark.asyncio
+async def test_expired_uploads_are_removed(uploads):
+    stale = await uploads.create(None, "user", "a.jpg", "image/jpeg", 6)
+    fresh = await uploads.create(None, "user", "b.jpg", "image/jpeg", 6)
+    past = time.time() - 61
+    for name in (str(stale.id), f"{stale.id}.json", f"{fresh.id}.json"):
+        os.utime(f"data/uploads/{name}", (past, past))
+    orphan = uuid4()
+    open(f"data/uploads/{orphan}", "wb").close()
+
+    with pytest.raises(UploadNotFound):
+        uploads.get(stale.id, "user")
+
+    uploads.clean()
+    # a fresh upload is kept by its partial file, whatever its metadata's age,
+    # a partial file without metadata only once it expired
+    assert sorted(os.listdir("data/uploads")) == sorted(
+        [str(fresh.id), f"{fresh.id}.json", str(orphan)]
+    )
+    os.utime(f"data/uploads/{orphan}", (past, past))
+    uploads.clean()
+    assert str(orphan) not in os.listdir("data/uploads")
+
+
+@pytest.mark.asyncio
+async def test_finish_upload_errors(admin_client, db_session, uploads):
+    from app.db import models
+
+    album_id = uuid4()
+    db_session.add(models.Album(id=album_id, name="Album", description="", order=0))
+    await db_session.commit()
+    content = jpeg_bytes()
+    response = await admin_client.post(
+        "/uploads",
+        json={
+            "album_id": str(album_id),
+            "content_type": "image/jpeg",
+            "size": len(content),
+        },
+    )
+    upload_id = UUID(response.json()["id"])
+    await admin_client.patch(
+        f"/uploads/{upload_id}", content=content, headers={"Upload-Offset": "0"}
+    )
+
+    # finished or written by another request at the same time
+    uploads._busy.add(upload_id)
+    with patch("app.main.processing_queue") as mock_queue:
+        response = await admin_client.post(f"/uploads/{upload_id}/finish")
+    uploads._busy.discard(upload_id)
+    assert response.status_code == 409
+    mock_queue.submit.assert_not_called()
+    assert uploads.get(upload_id, "test_user").offset == len(content)
+
+    await db_session.delete(await db_session.get(models.Album, album_id))
+    await db_session.commit()
+    response = await admin_client.post(f"/uploads/{upload_id}/finish")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Album not found"
+    assert (await db_session.execute(select(models.Item))).scalars().all() == []
@@ -25,6 +25,8 @@ export interface Album {
   /** Order */
   order: number;
   preview: Item | null;
+  /** Next */
+  next?: string | null;
 }
 
 /** AlbumCreate */
@@ -48,6 +50,18 @@ export interface AlbumList {
   id: string;
   /** Order */
   order: number;
+  /** Version */
+  version: number;
+  /** Item Count */
+  item_count: number;
+  /** Image Count */
+  image_count: number;
+  /** Video Count */
+  video_count: number;
+  /** Total Bytes */
+  total_bytes: number;
+  /** Newest Date */
+  newest_date: string | null;
   preview: Item | null;
 }
 
@@ -60,6 +74,8 @@ export interface AlbumOrder {
   id: string;
   /** Order */
   order: number;
+  /** Version */
+  version: number;
 }
 
 /** Body_upload_items */
@@ -98,8 +114,47 @@ export interface Item {
   path: string;
   /** Cover Path */
   cover_path: string;
+  /** Processed */
+  processed: boolean;
   /** Smoelen */
   smoelen: Smoel[];
+  /**
+   * Srcset
+   * @default []
+   */
+  srcset?: ItemSource[];
+  /** Hls */
+  hls?: string | null;
+}
+
+/** ItemMove */
+export interface ItemMove {
+  /**
+   * Album Id
+   * @format uuid
+   */
+  album_id: string;
+  /** Items */
+  items: string[];
+}
+
+/** ItemSource */
+export interface ItemSource {
+  /** Width */
+  width: number;
+  /** Url */
+  url: string;
+}
+
+/** ItemStatus */
+export interface ItemStatus {
+  /**
+   * Id
+   * @format uuid
+   */
+  id: string;
+  /** Processed */
+  processed: boolean;
 }
 
 /** Smoel */
@@ -124,6 +179,8 @@ export interface SmoelAlbum {
   id: string;
   /** Items */
   items: Item[];
+  /** Next */
+  next?: string | null;
 }
 
 /** SmoelAlbumList */
@@ -140,6 +197,58 @@ export interface SmoelAlbumList {
   items: Item[];
 }
 
+/** Upload */
+export interface Upload {
+  /**
+   * Id
+   * @format uuid
+   */
+  id: string;
+  /** Offset */
+  offset: number;
+  /** Size */
+  size: number;
+  /**
+   * Expires
+   * @format date-time
+   */
+  expires: string;
+}
+
+/** UploadCreate */
+export interface UploadCreate {
+  /**
+   * Album Id
+   * @format uuid
+   */
+  album_id: string;
+  /** Filename */
+  filename?: string | null;
+  /** Content Type */
+  content_type: string;
+  /**
+   * Size
+   * @min 0
+   */
+  size: number;
+}
+
+/** UploadFailure */
+export interface UploadFailure {
+  /** Filename */
+  filename: string | null;
+  /** Detail */
+  detail: string;
+}
+
+/** UploadResult */
+export interface UploadResult {
+  /** Items */
+  items: Item[];
+  /** Failed */
+  failed: UploadFailure[];
+}
+
 /** User */
 export interface User {
   /** Id */
@@ -156,6 +265,10 @@ export interface ValidationError {
   msg: string;
   /** Error Type */
   type: string;
+  /** Input */
+  input?: any;
+  /** Context */
+  ctx?: object;
 }
 
 export type QueryParamsType = Record<string | number, any>;
@@ -437,10 +550,24 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
      * @request GET:/albums/{album_id}
      * @secure
      */
-    getAlbum: (albumId: string, params: RequestParams = {}) =>
+    getAlbum: (
+      albumId: string,
+      query?: {
+        /**
+         * Limit
+         * @min 1
+         * @max 1000
+         */
+        limit?: number | null;
+        /** Cursor */
+        cursor?: string | null;
+      },
+      params: RequestParams = {},
+    ) =>
       this.request<Album, HTTPValidationError>({
         path: `/albums/${albumId}`,
         method: "GET",
+        query: query,
         secure: true,
         format: "json",
         ...params,
@@ -474,7 +601,7 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
      * @secure
      */
     deleteAlbum: (albumId: string, params: RequestParams = {}) =>
-      this.request<{ success: boolean }, HTTPValidationError>({
+      this.request<any, HTTPValidationError>({
         path: `/albums/${albumId}`,
         method: "DELETE",
         secure: true,
@@ -520,7 +647,7 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
      * @secure
      */
     uploadItems: (albumId: string, data: BodyUploadItems, params: RequestParams = {}) =>
-      this.request<Item[], HTTPValidationError>({
+      this.request<UploadResult, HTTPValidationError>({
         path: `/items/${albumId}`,
         method: "POST",
         body: data,
@@ -530,6 +657,23 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
         ...params,
       }),
 
+    /**
+     * No description
+     *
+     * @name GetItemStatus
+     * @summary Get Item Status
+     * @request GET:/items/{item_id}/status
+     * @secure
+     */
+    getItemStatus: (itemId: string, params: RequestParams = {}) =>
+      this.request<ItemStatus, HTTPValidationError>({
+        path: `/items/${itemId}/status`,
+        method: "GET",
+        secure: true,
+        format: "json",
+        ...params,
+      }),
+
     /**
      * No description
      *
@@ -548,6 +692,113 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
         format: "json",
         ...params,
       }),
+
+    /**
+     * No description
+     *
+     * @name MoveItems
+     * @summary Move Items
+     * @request POST:/items/{album_id}/move
+     * @secure
+     */
+    moveItems: (albumId: string, data: ItemMove, params: RequestParams = {}) =>
+      this.request<Album, HTTPValidationError>({
+        path: `/items/${albumId}/move`,
+        method: "POST",
+        body: data,
+        secure: true,
+        type: ContentType.Json,
+        format: "json",
+        ...params,
+      }),
+  };
+  uploads = {
+    /**
+     * No description
+     *
+     * @name CreateUpload
+     * @summary Create Upload
+     * @request POST:/uploads
+     * @secure
+     */
+    createUpload: (data: UploadCreate, params: RequestParams = {}) =>
+      this.request<Upload, HTTPValidationError>({
+        path: `/uploads`,
+        method: "POST",
+        body: data,
+        secure: true,
+        type: ContentType.Json,
+        format: "json",
+        ...params,
+      }),
+
+    /**
+     * No description
+     *
+     * @name GetUpload
+     * @summary Get Upload
+     * @request GET:/uploads/{upload_id}
+     * @secure
+     */
+    getUpload: (uploadId: string, params: RequestParams = {}) =>
+      this.request<Upload, HTTPValidationError>({
+        path: `/uploads/${uploadId}`,
+        method: "GET",
+        secure: true,
+        format: "json",
+        ...params,
+      }),
+
+    /**
+     * No description
+     *
+     * @name AppendUpload
+     * @summary Append Upload
+     * @request PATCH:/uploads/{upload_id}
+     * @secure
+     */
+    appendUpload: (uploadId: string, params: RequestParams = {}) =>
+      this.request<Upload, HTTPValidationError>({
+        path: `/uploads/${uploadId}`,
+        method: "PATCH",
+        secure: true,
+        format: "json",
+        ...params,
+      }),
+
+    /**
+     * No description
+     *
+     * @name DeleteUpload
+     * @summary Delete Upload
+     * @request DELETE:/uploads/{upload_id}
+     * @secure
+     */
+    deleteUpload: (uploadId: string, params: RequestParams = {}) =>
+      this.request<any, HTTPValidationError>({
+        path: `/uploads/${uploadId}`,
+        method: "DELETE",
+        secure: true,
+        format: "json",
+        ...params,
+      }),
+
+    /**
+     * No description
+     *
+     * @name FinishUpload
+     * @summary Finish Upload
+     * @request POST:/uploads/{upload_id}/finish
+     * @secure
+     */
+    finishUpload: (uploadId: string, params: RequestParams = {}) =>
+      this.request<UploadResult, HTTPValidationError>({
+        path: `/uploads/${uploadId}/finish`,
+        method: "POST",
+        secure: true,
+        format: "json",
+        ...params,
+      }),
   };
   users = {
     /**
@@ -593,10 +844,24 @@ export class Api<SecurityDataType extends unknown> extends HttpClient<SecurityDa
      * @request GET:/smoelen/{smoel_id}
      * @secure
      */
-    getSmoel: (smoelId: string, params: RequestParams = {}) =>
+    getSmoel: (
+      smoelId: string,
+      query?: {
+        /**
+         * Limit
+         * @min 1
+         * @max 1000
+         */
+        limit?: number | null;
+        /** Cursor */
+        cursor?: string | null;
+      },
+      params: RequestParams = {},
+    ) =>
       this.request<SmoelAlbum, HTTPValidationError>({
         path: `/smoelen/${smoelId}`,
         method: "GET",
+        query: query,
         secure: true,
         format: "json",
         ...params,